@@ -3,8 +3,9 @@ import time
 import random
 import sys
 import os
-from dotenv import load_dotenv
-from openai import AzureOpenAI
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "game_folder"))
+from llm_client import get_client
+from question_parser import parse_questions
 
 
 def get_questions(theme: str = None) -> tuple[ list[dict], list[list[str]] ]:
@@ -22,15 +23,8 @@ def get_questions(theme: str = None) -> tuple[ list[dict], list[list[str]] ]:
 
         list[list[str]]: 3 lists of strings, they are the list of guesses used by the AI opponent
     """
-    load_dotenv()
-    AZURE_API_KEY = os.getenv("AZURE_API_KEY")
-
-    # Initialize the client
-    client = AzureOpenAI(
-        azure_endpoint="https://cuhk-apip.azure-api.net",
-        api_version="2024-06-01",
-        api_key=AZURE_API_KEY,
-    )
+    # Shared client, its connections are kept alive between calls
+    client = get_client()
 
     theme_prompt = ""
     if theme != None:
@@ -59,54 +53,7 @@ def get_questions(theme: str = None) -> tuple[ list[dict], list[list[str]] ]:
         ],
         temperature=0.9,
     )
-    res = response.choices[0].message.content
-    res = res.split("\n")
-
-    ret = list()
-    ret2 = list()
-    temp = dict()  # Store current question
-    oppo_list = list()  # Store all answers of current question
-    for line in res:
-        if line.find("Question") != -1:
-            if len(oppo_list)>0:
-                ret2.append(oppo_list)
-            oppo_list = list()
-            temp = dict()  # start a new question
-            text = line[12:]
-            temp["question"] = text
-        else:
-            line = line.strip()
-            if len(line) < 1:  # empty line
-                continue
-            answer = ""
-            points = 0
-            text = line.split()
-            for word in text:
-                if word.isalpha():
-                    answer += word  # note that there are no spaces between words
-                elif word[0] == "(":
-                    points = int(word[1:-1])
-            answer = answer.lower()  # convert to lowercase
-            
-            if not "answer" in temp:
-                temp["answer"] = list()
-                temp["points"] = list()
-
-            if len(temp["answer"]) == 6: # handle oppo_list, keep original case and spaces
-                oppo_list.append(line[line.find(" ")+1:])
-            else:
-                oppo_list.append(line[line.find(" ")+1:line.rfind(" ")])
-            
-            if len(temp["answer"]) == 5:
-                temp["answer"].append(answer)
-                temp["points"].append(points)
-                ret.append(temp)
-            elif len(temp["answer"]) < 5:
-                temp["answer"].append(answer)
-                temp["points"].append(points)
-
-    ret2.append(oppo_list)
-    return (ret, ret2)
+    return parse_questions(response.choices[0].message.content)
 
 
 class Block:
@@ -0,0 +1,488 @@
+import threading
+import unicodedata
+from collections import Counter, OrderedDict
+
+MATCH_THRESHOLD = 0.8  # Share of an answer the guess must contain to count
+# How guesses are judged: longest common substring, or edit distance for typos
+MATCH_MODES = ("substring", "edit")
+GRAM_SIZE = 2
+TRIGRAM_SIZE = 3  # Answer_Index shortlists by trigrams, fewer answers share them
+BATCH_ROWS = 2048  # Guesses scored together by score_guesses
+
+
+def normalize_guess(text: str) -> str:
+    """Casefolded text without accents and spaces, used for both guesses and answers"""
+    text = unicodedata.normalize("NFKD", text.casefold())
+    return "".join(
+        char for char in text if not char.isspace() and not unicodedata.combining(char)
+    )
+
+
+def ngrams(text: str, size: int = GRAM_SIZE) -> Counter:
+    """Count of each n-gram, repeats matter for the bound in Answer_Key.score"""
+    return Counter(text[i : i + size] for i in range(len(text) - size + 1))
+
+
+class Guess:
+    """A player input, normalized once and then scored against every answer"""
+
+    __slots__ = ("text", "grams")
+
+    def __init__(self, player_input: str):
+        self.text = normalize_guess(player_input)
+        self.grams = ngrams(self.text)
+
+
+def edit_distance(masks: dict, length: int, text: str) -> int:
+    """
+    Damerau-Levenshtein distance (optimal string alignment) between an answer and text
+
+    Bit-parallel algorithm of Myers and Hyyro: bit i of the vectors holds the vertical
+    differences of row i of the distance table, so each character of text takes a
+    few integer operations, one machine word for answers up to 64 characters.
+
+    Args:
+        masks (dict): Bit mask of the positions of each character in the answer, Answer_Key.masks
+        length (int): Length of the answer
+        text (str): Normalized guess
+    """
+    if not length:
+        return len(text)
+    full = (1 << length) - 1
+    top = 1 << (length - 1)
+    plus, minus = full, 0  # Vertical differences of +1 and -1
+    zero = previous = (
+        0  # Diagonal differences of 0, match mask of the previous character
+    )
+    distance = length
+    for char in text:
+        match = masks.get(char, 0)
+        swapped = ((~zero & match) << 1) & previous  # Transpositions
+        zero = ((((match & plus) + plus) ^ plus) | match | minus | swapped) & full
+        horizontal_plus = minus | (~(zero | plus) & full)
+        horizontal_minus = zero & plus
+        if horizontal_plus & top:
+            distance += 1
+        elif horizontal_minus & top:
+            distance -= 1
+        # Row 0 of the table grows by one per character, hence the 1
+        shifted = ((horizontal_plus << 1) | 1) & full
+        minus = shifted & zero
+        plus = ((horizontal_minus << 1) | ~(shifted | zero)) & full
+        previous = match
+    return distance
+
+
+class Answer_Key:
+    """
+    Everything needed to judge guesses against one answer, built when the question is made
+
+    positions maps each character to where it occurs in the answer, so the longest
+    common substring only visits characters that match instead of every pair. masks
+    holds the same as bits, for the bit-parallel edit distance.
+    """
+
+    __slots__ = ("text", "grams", "positions", "masks", "need")
+
+    def __init__(self, answer: str, threshold: float = MATCH_THRESHOLD):
+        self.text = normalize_guess(answer)
+        self.grams = ngrams(self.text)
+        positions = dict()
+        for i, char in enumerate(self.text):
+            positions.setdefault(char, list()).append(i)
+        self.positions = {char: tuple(found) for char, found in positions.items()}
+        self.masks = {
+            char: sum(1 << i for i in found) for char, found in positions.items()
+        }
+        # Shortest common substring that reaches the threshold, same division as score
+        self.need = next(
+            length
+            for length in range(len(self.text) + 1)
+            if not self.text or length / len(self.text) >= threshold
+        )
+
+    def common_length(self, guess: str) -> int:
+        """Length of the longest common substring of guess and the answer"""
+        positions = self.positions
+        longest = 0
+        previous = dict()  # Answer position -> length of the match ending there
+        for char in guess:
+            current = dict()
+            for j in positions.get(char, ()):
+                length = previous.get(j - 1, 0) + 1
+                current[j] = length
+                if length > longest:
+                    longest = length
+            previous = current
+        return longest
+
+    def score(self, guess: Guess) -> float:
+        """
+        Share of the answer found in the guess, 0 if it cannot reach the threshold
+
+        A common substring of length L shares L - GRAM_SIZE + 1 n-grams counted with
+        repeats, so guesses with too few n-grams in common are rejected without scanning.
+        """
+        if not self.text or len(guess.text) < self.need:
+            return 0
+        if self.need >= GRAM_SIZE:
+            other = guess.grams
+            shared = sum(min(count, other[gram]) for gram, count in self.grams.items())
+            if shared < self.need - GRAM_SIZE + 1:
+                return 0
+        return self.common_length(guess.text) / len(self.text)
+
+    def edit_score(self, guess: Guess, threshold: float = MATCH_THRESHOLD) -> float:
+        """
+        Share of the typo budget left, at least threshold if the guess counts, else 0
+
+        The budget is the characters score lets a guess miss, floor(20%) of the answer
+        with the default threshold, but at least one edit so short answers forgive a
+        typo too. Unlike score, a transposed or mistyped letter costs one edit, and
+        extra text around the answer counts against the guess.
+        """
+        if not self.text:
+            return 0
+        allowed = max(1, len(self.text) - self.need)
+        # The distance is at least the difference in length
+        if abs(len(guess.text) - len(self.text)) > allowed:
+            return 0
+        distance = edit_distance(self.masks, len(self.text), guess.text)
+        if distance > allowed:
+            return 0
+        return threshold + (1 - threshold) * (allowed - distance) / allowed
+
+
+class Answer_Automaton:
+    """
+    Suffix automaton of all answers of a question, built once when the question starts
+
+    Every substring of any answer is a path from the root. Each state knows the answers
+    its substrings occur in, and reach[k] is the longest substring of answer k among
+    the state and its suffix links. Walking the guess through the automaton then gives
+    the longest common substring with every answer in one pass, in time linear in the
+    guess, without the table per answer.
+    """
+
+    __slots__ = ("lengths", "transitions", "links", "max_lengths", "reach")
+
+    def __init__(self, keys):
+        """
+        Args:
+            keys (iterable of Answer_Key): Answers of the question, scored in this order
+        """
+        keys = tuple(keys)
+        self.lengths = tuple(len(key.text) for key in keys)
+        self.transitions = [dict()]
+        self.links = links = [-1]
+        # Length of the longest substring in each state
+        self.max_lengths = max_lengths = [0]
+        masks = [0]  # Bit k is set if the substrings of the state occur in answer k
+
+        def new_state(length, transitions, link):
+            self.transitions.append(transitions)
+            max_lengths.append(length)
+            links.append(link)
+            masks.append(0)
+            return len(max_lengths) - 1
+
+        def clone(p, q, char):
+            """Split the shorter substrings of q into a new state, redirect p's transitions"""
+            state = new_state(max_lengths[p] + 1, dict(self.transitions[q]), links[q])
+            while p != -1 and self.transitions[p].get(char) == q:
+                self.transitions[p][char] = state
+                p = links[p]
+            links[q] = state
+            return state
+
+        def extend(last, char):
+            """State of the answer prefix last + char, adding it if it is new"""
+            q = self.transitions[last].get(char)
+            if q is not None:  # Also a substring of an earlier answer
+                if max_lengths[q] == max_lengths[last] + 1:
+                    return q
+                return clone(last, q, char)
+            state = new_state(max_lengths[last] + 1, dict(), 0)
+            p = last
+            while p != -1 and char not in self.transitions[p]:
+                self.transitions[p][char] = state
+                p = links[p]
+            if p != -1:
+                q = self.transitions[p][char]
+                if max_lengths[q] == max_lengths[p] + 1:
+                    links[state] = q
+                else:
+                    links[state] = clone(p, q, char)
+            return state
+
+        for k, length in enumerate(self.lengths):
+            last = 0
+            for char in keys[k].text:
+                last = extend(last, char)
+                masks[last] |= 1 << k
+
+        # Suffixes of a substring occur wherever it does, links lead to shorter states
+        order = sorted(range(len(max_lengths)), key=max_lengths.__getitem__)
+        for state in reversed(order[1:]):
+            masks[links[state]] |= masks[state]
+        num_answers = len(self.lengths)
+        self.reach = [(0,) * num_answers] * len(max_lengths)
+        for state in order[1:]:
+            parent = self.reach[links[state]]
+            self.reach[state] = tuple(
+                max_lengths[state] if masks[state] >> k & 1 else parent[k]
+                for k in range(num_answers)
+            )
+
+    def common_lengths(self, guess: str) -> list[int]:
+        """Length of the longest common substring of guess and each answer"""
+        transitions = self.transitions
+        links = self.links
+        max_lengths = self.max_lengths
+        reach = self.reach
+        best = [0] * len(self.lengths)
+        state = 0
+        length = (
+            0  # Length of the longest suffix of the guess so far found in an answer
+        )
+        for char in guess:
+            next_state = transitions[state].get(char)
+            while next_state is None and state:
+                state = links[state]
+                length = max_lengths[state]
+                next_state = transitions[state].get(char)
+            if next_state is None:
+                state = length = 0
+                continue
+            state = next_state
+            length += 1
+            for k, longest in enumerate(reach[state]):
+                found = longest if longest < length else length
+                if found > best[k]:
+                    best[k] = found
+        return best
+
+    def scores(self, guess: Guess) -> list[float]:
+        """Share of each answer found in the guess, the same as Answer_Key.common_length gives"""
+        return [
+            found / length if length else 0
+            for found, length in zip(self.common_lengths(guess.text), self.lengths)
+        ]
+
+
+class Answer_Index:
+    """
+    Trigram inverted index of answers, to shortlist the answers a guess can match
+
+    A common substring of length L shares L - 2 trigrams counted with repeats, so an
+    answer is only a candidate if the guess shares at least key.need - 2 trigrams with
+    it. Answers shorter than that bound can use are always candidates. Meant for
+    many answers, such as the keys of a whole question bank; for the few answers of
+    one question Answer_Automaton is faster than shortlisting them.
+    """
+
+    __slots__ = ("keys", "postings", "always")
+
+    def __init__(self, keys):
+        """
+        Args:
+            keys (iterable of Answer_Key): Answers to index, shortlisted by their position here
+        """
+        self.keys = tuple(keys)
+        postings = dict()  # trigram -> list of (answer, count in the answer)
+        always = list()  # Answers the trigrams say nothing about
+        for i, key in enumerate(self.keys):
+            if not key.text:
+                continue  # Scores 0, never a match
+            if key.need < TRIGRAM_SIZE:
+                always.append(i)
+                continue
+            for gram, count in ngrams(key.text, TRIGRAM_SIZE).items():
+                postings.setdefault(gram, list()).append((i, count))
+        self.postings = {gram: tuple(found) for gram, found in postings.items()}
+        self.always = tuple(always)
+
+    def shortlist(self, guess: Guess) -> list[int]:
+        """Positions of the answers that can reach their threshold, in order"""
+        shared = dict()
+        postings = self.postings
+        for gram, guess_count in ngrams(guess.text, TRIGRAM_SIZE).items():
+            for i, count in postings.get(gram, ()):
+                shared[i] = shared.get(i, 0) + min(count, guess_count)
+        keys = self.keys
+        found = [
+            i for i, count in shared.items() if count >= keys[i].need - TRIGRAM_SIZE + 1
+        ]
+        found.extend(self.always)
+        found.sort()
+        return found
+
+    def best_match(self, guess: Guess) -> tuple[int, float]:
+        """
+        Index and score of the best shortlisted answer, only those are scored
+
+        Returns:
+            tuple[int, float]: (-1, 0) if no answer is shortlisted or reaches its threshold
+        """
+        index, max_score = -1, 0
+        for i in self.shortlist(guess):
+            score = self.keys[i].score(guess)
+            if score > max_score:
+                index, max_score = i, score
+        return (index, max_score)
+
+
+class Answer_Memo:
+    """
+    Least recently used verdicts of the matching step, keyed by (question id, normalized guess)
+
+    Players resubmit the same guess, and many players send the same popular guesses to
+    the same question, so most guesses were already matched. Whether the answer was
+    already used is not stored, that is up to the caller on every guess.
+    """
+
+    def __init__(self, max_size: int = 4096):
+        """
+        Args:
+            max_size (int, optional): Verdicts kept, the least recently used are dropped. Defaults to 4096.
+        """
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._verdicts = OrderedDict()  # (question id, guess) -> (index, score)
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._verdicts)
+
+    def get(self, question_id, guess: str):
+        """
+        Returns:
+            tuple[int, float] or None: (index of the best answer, its score), None if not memoized
+        """
+        key = (question_id, guess)
+        with self._lock:
+            verdict = self._verdicts.get(key)
+            if verdict is None:
+                self.misses += 1
+                return None
+            self._verdicts.move_to_end(key)
+            self.hits += 1
+            return verdict
+
+    def put(self, question_id, guess: str, index: int, score: float):
+        with self._lock:
+            self._verdicts[(question_id, guess)] = (index, score)
+            self._verdicts.move_to_end((question_id, guess))
+            if len(self._verdicts) > self.max_size:
+                self._verdicts.popitem(last=False)
+
+    def clear(self):
+        """Drop every verdict, for when the questions the ids refer to change"""
+        with self._lock:
+            self._verdicts.clear()
+
+    def hit_ratio(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "size": len(self._verdicts),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hit_ratio(),
+            }
+
+
+def score_guesses(guesses, answers, threshold: float = MATCH_THRESHOLD):
+    """
+    Score many guesses against the answers of one question at once, with NumPy
+
+    Guesses and answers are normalized like in the game, and guesses that are the same
+    once normalized are scored once. Each character becomes its index in the sorted
+    characters of the answers, 0 if no answer has it, and a lookup of that index gives
+    the answer positions it matches. The longest common substring table is then filled
+    one guess position at a time for BATCH_ROWS guesses and all answers together,
+    keeping only the previous row.
+
+    Args:
+        guesses (iterable of str): Player inputs
+        answers (iterable of str): Answers of the question, scored in this order
+        threshold (float, optional): Score from which a guess counts as the answer. Defaults to MATCH_THRESHOLD.
+
+    Returns:
+        tuple[numpy.ndarray, numpy.ndarray]: Scores of shape (guesses, answers), the same as Answer_Automaton.scores gives, and the index of the best answer of each guess, -1 if it is below threshold
+    """
+    import numpy as np  # Only used for offline evaluation, not worth importing with the game
+
+    guesses = list(guesses)
+    # Repeats are common in logs of many games
+    normalized = {text: normalize_guess(text) for text in set(guesses)}
+    # Sorted by length, so a block of guesses is only padded to about its own length
+    unique = sorted(set(normalized.values()), key=len)
+    rows = {text: row for row, text in enumerate(unique)}
+    inverse = np.array([rows[normalized[text]] for text in guesses], dtype=np.intp)
+    answer_codes = encode_texts(np, [normalize_guess(text) for text in answers])
+    answer_lengths = (answer_codes >= 0).sum(axis=1)
+    num_guesses, num_answers = len(inverse), len(answer_codes)
+
+    alphabet = np.unique(answer_codes[answer_codes >= 0])
+    # matches[id] is where character id is in each answer, id 0 matches nothing
+    matches = char_ids(np, answer_codes, alphabet)[None] == np.arange(
+        len(alphabet) + 1, dtype=np.int16
+    ).reshape(-1, 1, 1)
+    matches[0] = False
+
+    longest = np.zeros((len(unique), num_answers), dtype=np.int16)
+    for start in range(0, len(unique), BATCH_ROWS):
+        guess_ids = char_ids(
+            np, encode_texts(np, unique[start : start + BATCH_ROWS]), alphabet
+        )
+        longest[start : start + BATCH_ROWS] = common_lengths(np, guess_ids, matches)
+    longest = longest[inverse]
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        scores = np.where(answer_lengths > 0, longest / answer_lengths, 0.0)
+    if num_answers == 0:
+        return scores, np.full(num_guesses, -1)
+    best = scores.argmax(axis=1)
+    best[scores[np.arange(num_guesses), best] < threshold] = -1
+    return scores, best
+
+
+def common_lengths(np, guess_ids, matches):
+    """Longest common substring of each guess and each answer, as (guesses, answers)"""
+    # Column 0 stays 0, so previous[:, :, :-1] + 1 is the diagonal step of the table
+    shape = (len(guess_ids), matches.shape[1], matches.shape[2] + 1)
+    previous = np.zeros(shape, dtype=np.int16)
+    current = np.zeros(shape, dtype=np.int16)
+    longest = np.zeros(shape, dtype=np.int16)
+    for i in range(guess_ids.shape[1]):
+        np.add(previous[:, :, :-1], 1, out=current[:, :, 1:])
+        current[:, :, 1:] *= matches[guess_ids[:, i]]
+        np.maximum(longest, current, out=longest)  # Reduced once after the loop
+        previous, current = current, previous
+    return longest.max(axis=2, initial=0)
+
+
+def encode_texts(np, texts: list[str]):
+    """Code points of each text as the rows of an int32 array, padded with -1"""
+    lengths = np.array([len(text) for text in texts], dtype=np.intp)
+    width = int(lengths.max(initial=0))
+    codes = np.full((len(texts), width), -1, dtype=np.int32)
+    # All texts in one buffer, spread over the rows by their lengths
+    codes[np.arange(width) < lengths[:, None]] = np.frombuffer(
+        "".join(texts).encode("utf-32-le"), np.uint32
+    )
+    return codes
+
+
+def char_ids(np, codes, alphabet):
+    """1 + index of each code point in the sorted alphabet, 0 for padding and other characters"""
+    if len(alphabet) == 0:
+        return np.zeros(codes.shape, dtype=np.int16)
+    ids = np.searchsorted(alphabet, codes)
+    found = alphabet[np.minimum(ids, len(alphabet) - 1)] == codes
+    return np.where(found, ids + 1, 0).astype(np.int16)
@@ -0,0 +1,139 @@
+"""
+Benchmark of judging guesses: the per-guess loop of the game against score_guesses, and
+a scan of every answer in the corpus against the trigram Answer_Index
+
+Guesses are made from the answers of the recorded LLM outputs in corpus/: exact
+answers, answers with a typo or an extra word, and answers of other questions.
+
+Usage:
+    python bench_answers.py
+    python bench_answers.py --guesses 20000 --seed 1
+"""
+
+import argparse
+import json
+import os
+import random
+
+from answer_match import (
+    Answer_Automaton,
+    Answer_Index,
+    Guess,
+    normalize_guess,
+    score_guesses,
+)
+from bench_parser import CORPUS_DIR, best_time
+from question_parser import parse_questions
+from question_set import Question_Set
+
+LETTERS = "abcdefghijklmnopqrstuvwxyz"
+
+
+def make_guesses(answers: list[str], other: list[str], count: int, rng) -> list[str]:
+    """count player inputs, some right, some close and some wrong"""
+    guesses = list()
+    for _ in range(count):
+        answer = rng.choice(answers)
+        kind = rng.randrange(4)
+        if kind == 1 and answer:  # Typos
+            for _ in range(rng.randint(1, 2)):
+                i = rng.randrange(len(answer))
+                answer = answer[:i] + rng.choice(LETTERS) + answer[i + 1 :]
+        elif kind == 2:  # Extra words
+            answer = f"{rng.choice(other)} {answer} {rng.choice(other)}"
+        elif kind == 3:
+            answer = rng.choice(other) + rng.choice(LETTERS)
+        guesses.append(answer)
+    return guesses
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark batch answer scoring")
+    parser.add_argument(
+        "--corpus", default=os.path.join(CORPUS_DIR, "llm_outputs.jsonl")
+    )
+    parser.add_argument("--guesses", type=int, default=10000, help="per question")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int)
+    args = parser.parse_args(argv)
+    rng = random.Random(args.seed)
+
+    with open(args.corpus, encoding="utf-8") as f:
+        completions = [json.loads(line)["content"] for line in f if line.strip()]
+    questions = [
+        question
+        for text in completions
+        for question in Question_Set.from_result(parse_questions(text))
+    ]
+    every_answer = [answer for question in questions for answer in question.display]
+    print(f"{len(questions)} questions, {args.guesses} guesses each")
+
+    # Both score a repeated guess once, like the Answer_Memo of the game, so the
+    # speedup is that of the scoring alone. The second run has no repeats at all
+    totals = {"all": [0, 0, 0], "distinct": [0, 0, 0]}  # guesses, loop, numpy
+    for question in questions:
+        guesses = make_guesses(list(question.answers), every_answer, args.guesses, rng)
+        distinct = list({normalize_guess(guess): guess for guess in guesses}.values())
+
+        keys = question.answer_keys()
+        for name, run in (("all", guesses), ("distinct", distinct)):
+
+            def loop():
+                matcher = Answer_Automaton(keys)
+                memo = dict()
+                scores = list()
+                for guess in run:
+                    guess = Guess(guess)
+                    if guess.text not in memo:
+                        memo[guess.text] = matcher.scores(guess)
+                    scores.append(memo[guess.text])
+                return scores
+
+            scores, _ = score_guesses(run, question.answers)
+            if scores.tolist() != loop():
+                raise AssertionError(f"scores differ for {question.text!r}")
+            total = totals[name]
+            total[0] += len(run)
+            total[1] += best_time(loop, args.repeat)
+            total[2] += best_time(
+                lambda: score_guesses(run, question.answers), args.repeat
+            )
+
+    for name, (num_guesses, loop_seconds, batch_seconds) in totals.items():
+        print(f"{name} guesses ({num_guesses}):")
+        for method, seconds in (("loop", loop_seconds), ("numpy", batch_seconds)):
+            print(
+                f"  {method}: {seconds * 1000:.0f} ms"
+                f" ({num_guesses / seconds:,.0f} guesses/s)"
+            )
+        print(f"  numpy is {loop_seconds / batch_seconds:.1f}x the loop")
+
+    # Matching against every answer of the corpus, like a whole question bank
+    keys = [key for question in questions for key in question.answer_keys()]
+    index = Answer_Index(keys)
+    guesses = [
+        Guess(guess)
+        for guess in make_guesses(every_answer, every_answer, args.guesses, rng)
+    ]
+
+    def scan():
+        return [
+            max((key.score(guess), -i) for i, key in enumerate(keys))
+            for guess in guesses
+        ]
+
+    shortlisted = sum(len(index.shortlist(guess)) for guess in guesses)
+    print(
+        f"bank of {len(keys)} answers, {shortlisted / len(guesses):.1f} shortlisted"
+        " by trigrams on average"
+    )
+    for name, func in (
+        ("scan", scan),
+        ("trigram index", lambda: [index.best_match(guess) for guess in guesses]),
+    ):
+        seconds = best_time(func, args.repeat)
+        print(f"{name}: {seconds / len(guesses) * 1e6:.1f} us per guess")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+"""
+Throughput benchmark of the question parser on the recorded LLM outputs in corpus/
+
+Usage:
+    python bench_parser.py
+    python bench_parser.py --corpus corpus/llm_outputs.jsonl --size 20 --chunk 20
+"""
+
+import argparse
+import json
+import os
+import time
+
+from question_json import Question_Json_Parser, parse_json_questions
+from question_parser import Question_Parser, parse_questions
+
+CORPUS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "corpus")
+
+
+def best_time(func, repeat: int) -> float:
+    """Fastest of repeat runs in seconds"""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def stream(new_parser, texts: list[str], chunk: int) -> int:
+    """Feed each text chunk characters at a time like a streamed response, returns questions parsed"""
+    count = 0
+    for text in texts:
+        parser = new_parser()
+        for i in range(0, len(text), chunk):
+            count += len(parser.feed(text[i : i + chunk]))
+        count += len(parser.close())
+    return count
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the question parser")
+    parser.add_argument("--corpus", help="default: the recordings in corpus/")
+    parser.add_argument("--json", action="store_true", help="JSON mode decoder")
+    parser.add_argument(
+        "--size", type=float, default=10, help="MB of responses for the benchmark"
+    )
+    parser.add_argument("--chunk", type=int, default=20, help="characters per chunk")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args(argv)
+    if args.json:
+        parse, new_parser = parse_json_questions, Question_Json_Parser
+        corpus = os.path.join(CORPUS_DIR, "llm_outputs_json.jsonl")
+    else:
+        parse, new_parser = parse_questions, Question_Parser
+        corpus = os.path.join(CORPUS_DIR, "llm_outputs.jsonl")
+    if args.corpus is not None:
+        corpus = args.corpus
+
+    with open(corpus, encoding="utf-8") as f:
+        completions = [json.loads(line)["content"] for line in f if line.strip()]
+    print(f"{len(completions)} recorded outputs in {corpus}")
+    for i, text in enumerate(completions):
+        questions, oppo_answers = parse(text)
+        print(
+            f"  #{i}: {len(questions)} questions,"
+            f" opponent answers {[len(oppo) for oppo in oppo_answers]}"
+        )
+
+    # Large batch generations and cache imports parse a lot of responses in one go
+    size = sum(len(text.encode("utf-8")) for text in completions)
+    bulk = completions * max(1, int(args.size * 1e6 / size))
+    megabytes = size * len(bulk) / len(completions) / 1e6
+    num_questions = sum(len(parse(text)[0]) for text in bulk)
+
+    def parse_all():
+        for text in bulk:
+            parse(text)
+
+    seconds = best_time(parse_all, args.repeat)
+    print(
+        f"bulk: {megabytes:.1f} MB, {num_questions} questions in {seconds * 1000:.0f} ms"
+        f" ({megabytes / seconds:.1f} MB/s, {num_questions / seconds:,.0f} questions/s)"
+    )
+    seconds = best_time(lambda: stream(new_parser, bulk, args.chunk), args.repeat)
+    print(
+        f"stream, {args.chunk} character chunks: {seconds * 1000:.0f} ms"
+        f" ({megabytes / seconds:.1f} MB/s)"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+"""
+Startup benchmark: import times of the game modules and time until the menu is drawn
+
+Each run is a fresh interpreter, so nothing is cached in sys.modules. The menu is drawn
+with the dummy SDL video driver, no window is opened. Questions come from the recordings
+in corpus/ and go to a temporary cache, so no request is sent and the real cache is not
+touched.
+
+Usage:
+    python bench_startup.py
+    python bench_startup.py --runs 10 --top 25
+"""
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+GAME_DIR = os.path.dirname(os.path.abspath(__file__))
+RECORDINGS = os.path.join(GAME_DIR, "corpus", "llm_outputs.jsonl")
+
+# Run in the child with the recordings and a cache directory as arguments, prints seconds
+# from interpreter start until the first menu frame
+MENU_SCRIPT = """
+import os, sys, time
+start = time.perf_counter()
+import pygame
+import game
+from question_backend import Recorded_Backend, set_backend
+from question_cache import Sharded_Question_Cache, set_default_cache
+set_backend(Recorded_Backend.from_file(sys.argv[1]))
+set_default_cache(Sharded_Question_Cache(sys.argv[2]))
+ui = game.Game_UI()
+ui.render()
+pygame.display.flip()
+print(time.perf_counter() - start, "openai" in __import__("sys").modules)
+os._exit(0)
+"""
+
+
+def import_times(module: str = "game") -> list[tuple[int, int, str]]:
+    """
+    Import module in a fresh interpreter with -X importtime
+
+    Returns:
+        list[tuple[int, int, str]]: (self microseconds, cumulative microseconds, module) of every import
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=GAME_DIR,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    times = list()
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:") :].split("|")
+        times.append((int(self_us), int(cumulative_us), name.rstrip()))
+    return times
+
+
+def menu_time() -> tuple[float, bool]:
+    """Seconds until the menu is drawn, and whether openai was imported by then"""
+    env = dict(os.environ, SDL_VIDEODRIVER="dummy", SDL_AUDIODRIVER="dummy")
+    with tempfile.TemporaryDirectory() as cache_dir:
+        result = subprocess.run(
+            [sys.executable, "-c", MENU_SCRIPT, RECORDINGS, cache_dir],
+            cwd=GAME_DIR,
+            env=env,
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+    seconds, openai_loaded = result.stdout.split()[-2:]
+    return (float(seconds), openai_loaded == "True")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the game startup")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=15, help="slowest imports shown")
+    args = parser.parse_args(argv)
+
+    times = import_times()
+    total = max(cumulative for _, cumulative, _ in times)
+    print(f"import game: {total / 1000:.0f} ms, {len(times)} modules")
+    print(f"{'cumulative':>12} {'self':>8}  module")
+    for self_us, cumulative_us, name in sorted(times, key=lambda t: -t[1])[: args.top]:
+        print(f"{cumulative_us / 1000:>9.1f} ms {self_us / 1000:>5.1f} ms  {name}")
+    heavy = [
+        name.strip() for _, _, name in times if name.strip() in ("openai", "httpx")
+    ]
+    print(f"openai/httpx imported by import game: {', '.join(heavy) or 'no'}")
+
+    runs = [menu_time() for _ in range(args.runs)]
+    seconds = [run[0] for run in runs]
+    print(
+        f"menu drawn after {statistics.median(seconds) * 1000:.0f} ms median,"
+        f" {min(seconds) * 1000:.0f} ms best of {args.runs}"
+    )
+    print(f"openai already imported by then: {sum(run[1] for run in runs)}/{args.runs}")
+
+
+if __name__ == "__main__":
+    main()
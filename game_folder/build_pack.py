@@ -0,0 +1,108 @@
+"""
+Build a question pack for playing offline
+
+Usage:
+    python build_pack.py questions.pack --cache
+    python build_pack.py questions.pack --cache old_question_cache.db
+    python build_pack.py questions.pack --jsonl sets.jsonl more_sets.jsonl
+
+Each JSONL line is either {"theme": ..., "questions": [...], "oppo_answers": [...]}
+or a [questions, oppo_answers] pair as returned by Question_Generator.get_questions.
+"""
+
+import argparse
+import json
+import sys
+import time
+
+from question_cache import DEFAULT_SHARD_DIR, open_cache
+from question_dedup import Question_Index
+from question_generator import Question_Generator
+from question_pack import write_pack
+
+
+def read_jsonl(path: str, default_theme: str = None):
+    """Yield (theme, question, opponent answers) of every question in a JSONL file"""
+    with open(path, encoding="utf-8") as f:
+        for line_no, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                value = json.loads(line)
+                if isinstance(value, dict):
+                    theme = value.get("theme", default_theme)
+                    questions = value["questions"]
+                    oppo_answers = value["oppo_answers"]
+                else:
+                    theme = default_theme
+                    questions, oppo_answers = value
+            except (ValueError, KeyError, TypeError):
+                print(f"{path}:{line_no}: skipped, not a question set", file=sys.stderr)
+                continue
+            for question, oppo_list in zip(questions, oppo_answers):
+                yield (theme, question, oppo_list)
+
+
+def read_cache(path: str, prompt_version: str):
+    """Yield (theme, question, opponent answers) of every cached question"""
+    cache = open_cache(path)
+    try:
+        for theme, _, value in cache.iter_sets(prompt_version):
+            questions, oppo_answers = value
+            for question, oppo_list in zip(questions, oppo_answers):
+                yield (theme or None, question, oppo_list)
+    finally:
+        cache.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build a question pack")
+    parser.add_argument("output", help="question pack file to write")
+    parser.add_argument(
+        "--cache",
+        nargs="?",
+        const=DEFAULT_SHARD_DIR,
+        help="read the question cache (default: %(const)s)",
+    )
+    parser.add_argument(
+        "--prompt-version",
+        default=Question_Generator.PROMPT_VERSION,
+        help="only use cached sets of this prompt version (default: %(default)s)",
+    )
+    parser.add_argument("--jsonl", nargs="*", default=[], help="JSONL files to read")
+    parser.add_argument("--theme", help="theme of JSONL sets that do not name one")
+    parser.add_argument(
+        "--dedup", action="store_true", help="skip repeats of questions already added"
+    )
+    args = parser.parse_args(argv)
+    if args.cache is None and not args.jsonl:
+        parser.error("nothing to read, give --cache and/or --jsonl")
+
+    def entries():
+        if args.cache is not None:
+            yield from read_cache(args.cache, args.prompt_version)
+        for path in args.jsonl:
+            yield from read_jsonl(path, args.theme)
+
+    index = Question_Index() if args.dedup else None
+    skipped = 0
+
+    def new_entries():
+        nonlocal skipped
+        for theme, question, oppo_list in entries():
+            if index is not None and not index.add(question["question"]):
+                skipped += 1
+                continue
+            yield (theme, question, oppo_list)
+
+    start = time.perf_counter()
+    count = write_pack(args.output, new_entries())
+    elapsed = time.perf_counter() - start
+    print(f"Wrote {count} questions to {args.output} in {elapsed:.2f}s")
+    if index is not None:
+        print(f"Skipped {skipped} repeated questions")
+
+
+if __name__ == "__main__":
+    main()
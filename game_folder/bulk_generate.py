@@ -0,0 +1,275 @@
+"""
+Generate question sets for many themes overnight, into the question cache or a pack
+
+Requests run concurrently under a requests/tokens per minute budget and slow down on
+429 responses. Progress is checkpointed after every request, run the same command
+again to resume an interrupted run.
+
+Usage:
+    python bulk_generate.py Food Animals Sports=50 --games 20 --cache
+    python bulk_generate.py Food Animals --games 100 --pack food.pack --rpm 120 --tpm 60000
+"""
+
+import argparse
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+
+from build_pack import read_jsonl
+from llm_client import registry
+from question_backend import Azure_Backend, set_backend
+from question_cache import DEFAULT_SHARD_DIR, open_cache, theme_key
+from question_generator import FETCH_DEADLINE, QUESTIONS_PER_GAME, Question_Generator
+from question_pack import write_pack
+from rate_limit import Rate_Limiter, is_rate_limited, retry_after
+
+PROMPT_TOKENS = 250  # Rough size of the prompt
+TOKENS_PER_QUESTION = 90  # Rough size of a question with its 10 answers
+
+
+class Bulk_Job:
+    """
+    Remaining games of each theme, shared by the workers
+
+    Games are reserved before a request and either marked done or handed back, and the
+    done counts are written to the checkpoint file after every request.
+    """
+
+    def __init__(self, targets: dict, checkpoint_path: str, games_per_request: int):
+        self.targets = targets  # theme -> games wanted
+        self.checkpoint_path = checkpoint_path
+        self.games_per_request = games_per_request
+        self.done = dict.fromkeys(targets, 0)
+        self._reserved = dict.fromkeys(targets, 0)
+        self._lock = threading.Lock()
+        if os.path.exists(checkpoint_path):
+            with open(checkpoint_path, encoding="utf-8") as f:
+                saved = json.load(f)
+            if saved.get("prompt_version") == Question_Generator.PROMPT_VERSION:
+                for theme, count in saved.get("done", dict()).items():
+                    if theme in self.done:
+                        self.done[theme] = count
+
+    def reserve(self):
+        """
+        Reserve the games of the next request
+
+        Returns:
+            tuple[str, int] or None: (theme, games), None if nothing is left to reserve
+        """
+        with self._lock:
+            # The theme furthest from its target first, so all themes progress evenly
+            theme = min(
+                self.targets,
+                key=lambda t: (self.done[t] + self._reserved[t]) / self.targets[t],
+            )
+            left = self.targets[theme] - self.done[theme] - self._reserved[theme]
+            if left <= 0:
+                return None
+            games = min(left, self.games_per_request)
+            self._reserved[theme] += games
+            return (theme, games)
+
+    def release(self, theme: str, games: int, done: int = 0):
+        """Hand back reserved games, done of them were generated"""
+        with self._lock:
+            self._reserved[theme] -= games
+            self.done[theme] += done
+            if done:
+                self._save()
+
+    def remaining(self) -> int:
+        with self._lock:
+            return sum(max(self.targets[t] - self.done[t], 0) for t in self.targets)
+
+    def _save(self):
+        """Write the checkpoint atomically, caller must hold the lock"""
+        temp_path = self.checkpoint_path + ".tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump(
+                {
+                    "prompt_version": Question_Generator.PROMPT_VERSION,
+                    "done": self.done,
+                },
+                f,
+            )
+        os.replace(temp_path, self.checkpoint_path)
+
+
+def parse_targets(specs: list[str], default_games: int) -> dict:
+    """
+    "Food" and "Food=30" theme arguments to {theme: games}, "any" for no theme
+
+    Raises:
+        ValueError: A number of games is not a positive integer
+    """
+    targets = dict()
+    for spec in specs:
+        theme, _, games = spec.partition("=")
+        theme = theme.strip()
+        targets[theme] = int(games) if games else default_games
+        if targets[theme] <= 0:
+            raise ValueError(f"{spec}: the number of games must be positive")
+    return targets
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate question sets in bulk")
+    parser.add_argument(
+        "themes", nargs="+", help='THEME or THEME=GAMES, "any" for no theme'
+    )
+    parser.add_argument("--games", type=int, default=10, help="games per theme")
+    output = parser.add_mutually_exclusive_group(required=True)
+    output.add_argument(
+        "--cache",
+        nargs="?",
+        const=DEFAULT_SHARD_DIR,
+        help="store sets in the question cache (default: %(const)s)",
+    )
+    output.add_argument(
+        "--pack", help="build a pack, sets are collected in PACK.jsonl until then"
+    )
+    parser.add_argument("--checkpoint", help="default: next to the output")
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--games-per-request", type=int, default=5)
+    parser.add_argument("--rpm", type=float, default=60, help="requests per minute")
+    parser.add_argument("--tpm", type=float, help="tokens per minute")
+    parser.add_argument(
+        "--max-failures",
+        type=int,
+        default=10,
+        help="give up after this many failed requests in a row, 429s not counted",
+    )
+    parser.add_argument(
+        "--no-dedup", action="store_true", help="keep questions already in the cache"
+    )
+    parser.add_argument("--endpoint", help="LLM endpoint, e.g. a Fake_LLM_Server url")
+    args = parser.parse_args(argv)
+
+    try:
+        targets = parse_targets(args.themes, args.games)
+    except ValueError as e:
+        parser.error(str(e))
+    output_path = args.cache if args.cache is not None else args.pack
+    checkpoint_path = args.checkpoint or output_path.rstrip("/\\") + ".checkpoint.json"
+    job = Bulk_Job(targets, checkpoint_path, args.games_per_request)
+    limiter = Rate_Limiter(args.rpm, args.tpm)
+    if args.endpoint is not None:
+        set_backend(Azure_Backend(endpoint=args.endpoint))
+    # 429s reach the rate limiter instead of being retried blindly by the SDK
+    registry.configure(max_retries=0)
+    Question_Generator.dedup = not args.no_dedup
+
+    if args.cache is not None:
+        cache = open_cache(args.cache)
+        jsonl = None
+    else:
+        cache = None
+        jsonl = open(args.pack + ".jsonl", "a", encoding="utf-8")
+    write_lock = threading.Lock()
+
+    def store(theme, question_sets):
+        for questions, oppo_answers in question_sets:
+            if cache is not None:
+                cache.put(
+                    theme, Question_Generator.PROMPT_VERSION, [questions, oppo_answers]
+                )
+            else:
+                line = json.dumps(
+                    {
+                        "theme": theme,
+                        "questions": questions,
+                        "oppo_answers": oppo_answers,
+                    }
+                )
+                with write_lock:
+                    jsonl.write(line + "\n")
+        if jsonl is not None:
+            with write_lock:
+                jsonl.flush()  # Stored before the checkpoint counts it
+
+    failures = 0  # Failed requests in a row, shared by the workers
+    failures_lock = threading.Lock()
+    stop = threading.Event()
+
+    def count_failure(failed: bool):
+        nonlocal failures
+        with failures_lock:
+            failures = failures + 1 if failed else 0
+            if failures >= args.max_failures:
+                stop.set()
+
+    def worker():
+        while not stop.is_set():
+            reserved = job.reserve()
+            if reserved is None:
+                return
+            theme, games = reserved
+            llm_theme = None if theme_key(theme) == "any" else theme
+            limiter.acquire(
+                PROMPT_TOKENS + games * QUESTIONS_PER_GAME * TOKENS_PER_QUESTION
+            )
+            try:
+                # Failures are handled here, 429s by the limiter and the rest by
+                # --max-failures, so the circuit breaker of the game is left out
+                question_sets = Question_Generator.get_question_batch(
+                    llm_theme,
+                    games,
+                    breaker=False,
+                    deadline=FETCH_DEADLINE * games,
+                )
+            except Exception as e:
+                job.release(theme, games)
+                if is_rate_limited(e):
+                    limiter.rate_limited(retry_after(e))
+                    continue
+                print(f"{theme}: request failed, {e!r}")
+                count_failure(True)
+                continue
+            limiter.success()
+            question_sets = question_sets[:games]
+            if not question_sets:  # Cut short or all repeats, counts as a failure
+                job.release(theme, games)
+                count_failure(True)
+                continue
+            count_failure(False)
+            store(llm_theme, question_sets)
+            job.release(theme, games, done=len(question_sets))
+
+    total = sum(targets.values())
+    print(f"{total - job.remaining()}/{total} games already done ({checkpoint_path})")
+    start = time.monotonic()
+    try:
+        with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+            futures = [executor.submit(worker) for _ in range(args.concurrency)]
+            try:
+                while wait(futures, timeout=5).not_done:
+                    print(
+                        f"{total - job.remaining()}/{total} games,"
+                        f" {time.monotonic() - start:.0f}s, {limiter.stats()}"
+                    )
+            except KeyboardInterrupt:  # Checkpoint is up to date, run again to resume
+                stop.set()
+                print("Interrupted, finishing running requests")
+                raise
+            for future in futures:
+                future.result()
+    finally:
+        if cache is not None:
+            cache.close()
+        else:
+            jsonl.close()
+
+    if stop.is_set():
+        print(f"Stopped after {args.max_failures} failed requests in a row")
+    print(f"{total - job.remaining()}/{total} games done: {job.done}")
+    print(f"rate limiter: {limiter.stats()}")
+    if args.pack is not None:
+        count = write_pack(args.pack, read_jsonl(args.pack + ".jsonl"))
+        print(f"Wrote {count} questions to {args.pack}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+import threading
+import time
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class Circuit_Open(Exception):
+    """The backend is considered down, no request was sent"""
+
+
+class Circuit_Breaker:
+    """
+    Stop sending requests to a backend that keeps failing
+
+    After failure_threshold failures in a row the circuit opens and allow() returns
+    False at once, so callers serve a stale set instead of waiting for another timeout.
+    Once reset_timeout has passed a single probe runs on a background thread, a success
+    closes the circuit and a failure keeps it open for twice as long. Without a probe
+    function the next caller is let through as the probe instead (half open).
+    """
+
+    def __init__(
+        self,
+        failure_threshold: int = 3,
+        reset_timeout: float = 30,
+        max_reset_timeout: float = 300,
+        probe=None,
+    ):
+        """
+        Args:
+            failure_threshold (int, optional): Failures in a row that open the circuit. Defaults to 3.
+            reset_timeout (float, optional): Seconds the circuit stays open before the first probe. Defaults to 30.
+            max_reset_timeout (float, optional): Longest wait between probes, the wait doubles after each failed probe. Defaults to 300.
+            probe (callable, optional): Called without arguments on a background thread to check for recovery, should raise on failure. Defaults to None.
+        """
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.max_reset_timeout = max_reset_timeout
+        self.probe = probe
+        self.state = CLOSED
+        self.failures = 0  # Failures in a row
+        self.opened = 0  # Times the circuit opened
+        self.rejected = 0  # Calls of allow() that returned False
+        self.probes = 0
+        self.requests = 0  # Requests for a set, see record_fallback
+        self.fallbacks = 0  # Of those, served from stale sets
+        self._lock = threading.Lock()
+        self._timeout = reset_timeout
+        self._retry_at = 0
+        self._probing = False
+
+    def allow(self) -> bool:
+        """Whether a request may be sent now, False means serve a fallback"""
+        with self._lock:
+            if self.state == CLOSED:
+                return True
+            now = time.monotonic()
+            # A half open probe that never reported back is replaced after the timeout
+            if now >= self._retry_at:
+                if self.probe is None:
+                    self.state = HALF_OPEN  # This caller is the probe
+                    self.probes += 1
+                    self._retry_at = now + self._timeout
+                    return True
+                if not self._probing:
+                    self._probing = True
+                    self.probes += 1
+                    threading.Thread(target=self._run_probe, daemon=True).start()
+            self.rejected += 1
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.state = CLOSED
+            self._timeout = self.reset_timeout
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == HALF_OPEN:  # The probe failed
+                self._open(self._timeout * 2)
+            elif self.state == CLOSED and self.failures >= self.failure_threshold:
+                self._open(self.reset_timeout)
+
+    def record_fallback(self, fallback: bool):
+        """Count a request for a set, fallback if a stale set was served instead of a new one"""
+        with self._lock:
+            self.requests += 1
+            self.fallbacks += int(fallback)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "state": self.state,
+                "failures": self.failures,
+                "opened": self.opened,
+                "rejected": self.rejected,
+                "probes": self.probes,
+                "fallbacks": self.fallbacks,
+                "fallback_rate": (
+                    self.fallbacks / self.requests if self.requests else 0.0
+                ),
+            }
+
+    def _open(self, timeout):
+        """Caller must hold the lock"""
+        if self.state != OPEN:
+            self.opened += 1
+        self.state = OPEN
+        self._timeout = min(timeout, self.max_reset_timeout)
+        self._retry_at = time.monotonic() + self._timeout
+
+    def _run_probe(self):
+        try:
+            self.probe()
+        except Exception:
+            with self._lock:
+                self._probing = False
+                self._open(self._timeout * 2)
+            return
+        with self._lock:
+            self._probing = False
+        self.record_success()
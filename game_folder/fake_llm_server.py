@@ -0,0 +1,278 @@
+"""
+Local stand-in for the Azure OpenAI chat completions API, for load testing without network
+
+Replays recorded responses with configurable latency and injected errors. Everything
+random comes from one seeded generator, so a run with the same seed and the same
+request order sees the same latency spikes and errors.
+
+Usage:
+    python fake_llm_server.py recordings.jsonl --port 8000 --latency 1.5 --error-rate 0.1
+
+Then point the game at it with
+    set_backend(Azure_Backend(endpoint="http://127.0.0.1:8000", api_key="fake"))
+"""
+
+import argparse
+import json
+import random
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from question_backend import load_recordings
+
+
+class Fake_LLM_Server:
+    """Serves recorded completions over HTTP on a background thread"""
+
+    def __init__(
+        self,
+        completions: list[str],
+        host: str = "127.0.0.1",
+        port: int = 0,
+        latency: float = 0,
+        latency_jitter: float = 0,
+        spike_rate: float = 0,
+        spike_latency: float = 10,
+        chunk_size: int = 20,
+        chunk_delay: float = 0,
+        error_rate: float = 0,
+        error_status: int = 500,
+        seed: int = None,
+    ):
+        """
+        Args:
+            completions (list[str]): Response texts, replayed in turn
+            host (str, optional): Address to listen on. Defaults to "127.0.0.1".
+            port (int, optional): Port to listen on, 0 picks a free one. Defaults to 0.
+            latency (float, optional): Seconds before the first byte of a response. Defaults to 0.
+            latency_jitter (float, optional): Uniform random seconds added to latency. Defaults to 0.
+            spike_rate (float, optional): Share of requests that wait spike_latency instead. Defaults to 0.
+            spike_latency (float, optional): Seconds before the first byte of a spike. Defaults to 10.
+            chunk_size (int, optional): Characters per streamed chunk. Defaults to 20.
+            chunk_delay (float, optional): Seconds between streamed chunks. Defaults to 0.
+            error_rate (float, optional): Share of requests answered with error_status. Defaults to 0.
+            error_status (int, optional): HTTP status of injected errors. Defaults to 500.
+            seed (int, optional): Seed of the latency and error decisions. Defaults to None.
+        """
+        if not completions:
+            raise ValueError("Need at least one recorded completion")
+        self.completions = list(completions)
+        self.latency = latency
+        self.latency_jitter = latency_jitter
+        self.spike_rate = spike_rate
+        self.spike_latency = spike_latency
+        self.chunk_size = chunk_size
+        self.chunk_delay = chunk_delay
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.requests = 0
+        self.errors = 0  # Injected errors
+        self.spikes = 0  # Requests that got spike_latency
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._server = _Server((host, port), _Handler)
+        self._server.fake = self
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def serve_forever(self):
+        """Serve on the calling thread until interrupted"""
+        self._server.serve_forever()
+
+    def stop(self):
+        if self._thread is not None:
+            self._server.shutdown()
+            self._thread = None
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "requests": self.requests,
+                "errors": self.errors,
+                "spikes": self.spikes,
+            }
+
+    def plan(self):
+        """Decide the next response, returns (delay, error status or None, text)"""
+        with self._lock:
+            number = self.requests
+            self.requests += 1
+            if self._rng.random() < self.spike_rate:
+                self.spikes += 1
+                delay = self.spike_latency
+            else:
+                delay = self.latency + self._rng.uniform(0, self.latency_jitter)
+            error = None
+            if self._rng.random() < self.error_rate:
+                self.errors += 1
+                error = self.error_status
+        return (delay, error, self.completions[number % len(self.completions)])
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # Cancelled and hedged requests hang up early, that is expected
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # Keep-alive, like the real API
+
+    def do_POST(self):
+        fake = self.server.fake
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        if not self.path.split("?")[0].endswith("/chat/completions"):
+            self._send_json(404, {"error": {"code": "404", "message": "Not found"}})
+            return
+        try:
+            request = json.loads(body or b"{}")
+        except ValueError:
+            self._send_json(400, {"error": {"code": "400", "message": "Bad JSON"}})
+            return
+
+        delay, error, text = fake.plan()
+        time.sleep(delay)
+        if error is not None:
+            self._send_json(
+                error,
+                {"error": {"code": str(error), "message": "Injected error"}},
+                {"Retry-After": "1"} if error == 429 else None,
+            )
+            return
+
+        model = request.get("model", "gpt-4o")
+        if request.get("stream"):
+            self._send_stream(fake, model, text)
+        else:
+            self._send_json(
+                200,
+                {
+                    "id": "chatcmpl-fake",
+                    "object": "chat.completion",
+                    "created": int(time.time()),
+                    "model": model,
+                    "choices": [
+                        {
+                            "index": 0,
+                            "message": {"role": "assistant", "content": text},
+                            "finish_reason": "stop",
+                        }
+                    ],
+                    "usage": {
+                        "prompt_tokens": 0,
+                        "completion_tokens": len(text) // 4,
+                        "total_tokens": len(text) // 4,
+                    },
+                },
+            )
+
+    def _send_json(self, status, value, headers=None):
+        data = json.dumps(value).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, header in (headers or dict()).items():
+            self.send_header(name, header)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _send_stream(self, fake, model, text):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        created = int(time.time())
+        try:
+            for i in range(0, len(text), fake.chunk_size):
+                if i and fake.chunk_delay:
+                    time.sleep(fake.chunk_delay)
+                self._send_event(
+                    {
+                        "id": "chatcmpl-fake",
+                        "object": "chat.completion.chunk",
+                        "created": created,
+                        "model": model,
+                        "choices": [
+                            {
+                                "index": 0,
+                                "delta": {"content": text[i : i + fake.chunk_size]},
+                                "finish_reason": None,
+                            }
+                        ],
+                    }
+                )
+            self._send_event("[DONE]")
+            self.wfile.write(b"0\r\n\r\n")
+        except ConnectionError:  # Client stopped reading
+            self.close_connection = True
+
+    def _send_event(self, value):
+        data = value if isinstance(value, str) else json.dumps(value)
+        event = f"data: {data}\n\n".encode("utf-8")
+        self.wfile.write(f"{len(event):x}\r\n".encode("ascii") + event + b"\r\n")
+        self.wfile.flush()
+
+    def log_message(self, format, *args):
+        pass  # Too noisy under load
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Fake LLM server for load testing")
+    parser.add_argument("recordings", help="JSONL file of recorded completions")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--latency", type=float, default=0)
+    parser.add_argument("--jitter", type=float, default=0)
+    parser.add_argument("--spike-rate", type=float, default=0)
+    parser.add_argument("--spike-latency", type=float, default=10)
+    parser.add_argument("--chunk-delay", type=float, default=0)
+    parser.add_argument("--error-rate", type=float, default=0)
+    parser.add_argument("--error-status", type=int, default=500)
+    parser.add_argument("--seed", type=int)
+    args = parser.parse_args(argv)
+
+    server = Fake_LLM_Server(
+        load_recordings(args.recordings),
+        host=args.host,
+        port=args.port,
+        latency=args.latency,
+        latency_jitter=args.jitter,
+        spike_rate=args.spike_rate,
+        spike_latency=args.spike_latency,
+        chunk_delay=args.chunk_delay,
+        error_rate=args.error_rate,
+        error_status=args.error_status,
+        seed=args.seed,
+    )
+    print(f"Serving {len(server.completions)} completions on {server.url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,11 +1,45 @@
+import argparse
 import pygame
 import time
 import random
 import sys
 import os
-from dotenv import load_dotenv
-from openai import AzureOpenAI
 from pygame.transform import smoothscale_by
+from answer_match import (
+    MATCH_MODES,
+    MATCH_THRESHOLD,
+    Answer_Automaton,
+    Answer_Memo,
+    Guess,
+)
+from llm_client import shutdown as shutdown_clients
+from metrics import registry
+from question_generator import Question_Generator
+from question_pack import Question_Pack
+from question_pool import Question_Pool
+from question_prefetch import Partial_Set, Question_Prefetcher
+
+# Themes of the theme picker when playing online, a pack offers its own
+THEMES = [
+    "Food",
+    "Animals",
+    "Sports",
+    "Movies",
+    "Music",
+    "Science",
+    "Travel",
+    "School",
+    "Holidays",
+    "Jobs",
+]
+VISIBLE_THEMES = 4  # Theme buttons shown at once, the mouse wheel scrolls the rest
+# Menu button text of each mode of MATCH_MODES
+MATCH_MODE_NAMES = {"substring": "Match: contains", "edit": "Match: typos OK"}
+
+game_start_seconds = registry.histogram(
+    "game_start_seconds",
+    "Seconds from clicking a mode to the first question on screen, by where the set came from",
+)
 
 
 class Block:
@@ -324,118 +358,9 @@ class Audience:
         self.spectators.draw(screen)
 
 
-class Question_Generator:
-    @staticmethod
-    def get_questions(theme: str = None) -> tuple[list[dict], list[list[str]]]:
-        """
-        Generate questions and answers based on a specified theme
-
-        Args:
-            theme (str, optional): Theme for the questions. Defaults to None.
-
-        Returns tuple of two elements:
-
-            list[dict]: A list of 3 question dictionaries, each containing:
-                - question (str): The question
-                - answer (list[str]): List of the 6 answers in lowercase
-                - points (list[int]): Corresponding points for each answer
-
-            list[list[str]]: 3 lists of strings, they are the list of guesses used by the AI opponent
-        """
-        load_dotenv()
-        AZURE_API_KEY = os.getenv("AZURE_API_KEY")
-
-        # Initialize the client
-        client = AzureOpenAI(
-            azure_endpoint="https://cuhk-apip.azure-api.net",
-            api_version="2024-06-01",
-            api_key=AZURE_API_KEY,
-        )
-
-        theme_prompt = ""
-        if theme != None:
-            theme_prompt = "related to the theme " + theme
-
-        response = client.chat.completions.create(
-            model="gpt-4o",
-            messages=[
-                {"role": "system", "content": "You are a helpful assistant."},
-                {
-                    "role": "user",
-                    "content": (
-                        "Create 3 questions for playing the 'Guess Their Answer' game "
-                        + theme_prompt
-                        + ","
-                        "each question has 10 answers with the first 6 answers being the most popular ones. "
-                        "Restrict your question to at most 60 characters long. "
-                        "Restrict each answer to at most 2 words"
-                        "Do not use any text formatting in your response, "
-                        "In the answers, do not include any numbers or symbols. "
-                        "Use 'Question 1: ','Question 2: ','Question 3: ' to indicate each question, "
-                        "then use a numbered list for the answers"
-                        "Assign a total of 100 points to the first 6 answers, put them in a bracket after each answer, "
-                        "do not include anything else in the brackets"
-                    ),
-                },
-            ],
-            temperature=0.9,
-        )
-        res = response.choices[0].message.content
-        res = res.split("\n")
-
-        ret = list()
-        ret2 = list()
-        temp = dict()  # Store current question
-        oppo_list = list()  # Store all answers of current question
-        for line in res:
-            if line.find("Question") != -1:
-                if len(oppo_list) > 0:
-                    ret2.append(oppo_list)
-                oppo_list = list()
-                temp = dict()  # start a new question
-                text = line[12:]
-                temp["question"] = text
-            else:
-                line = line.strip()
-                if len(line) < 1:  # empty line
-                    continue
-                answer = ""
-                points = 0
-                text = line.split()
-                for i in range(1, len(text)):
-                    word = text[i]
-                    if word[0] == "(":
-                        points = int(word[1:-1])
-                    else:
-                        answer += word  # note that there are no spaces between words
-                answer = answer.lower()  # convert to lowercase
-
-                if not "answer" in temp:
-                    temp["answer"] = list()
-                    temp["points"] = list()
-
-                if (
-                    len(temp["answer"]) == 6
-                ):  # handle oppo_list, keep original case and spaces
-                    oppo_list.append(line[line.find(" ") + 1 :])
-                else:
-                    oppo_list.append(line[line.find(" ") + 1 : line.rfind(" ")])
-
-                if len(temp["answer"]) == 5:
-                    temp["answer"].append(answer)
-                    temp["points"].append(points)
-                    ret.append(temp)
-                elif len(temp["answer"]) < 5:
-                    temp["answer"].append(answer)
-                    temp["points"].append(points)
-
-        ret2.append(oppo_list)
-        return (ret, ret2)
-
-
 class Bot:
-    def __init__(self, oppo_answers, oppo_sprite):
-        self.oppo_answers = oppo_answers
+    def __init__(self, questions, oppo_sprite):
+        self.questions = questions  # list of Question, the bot answers from display
         self.oppo_sprite = oppo_sprite
         self.current_question = -1
         self.answer_timer = 0
@@ -454,7 +379,7 @@ class Bot:
     def update(self, current_time):
         """Check if bot should answer now and return answer if ready"""
         if self.current_question == -1 or len(self.answers_used) >= len(
-            self.oppo_answers[self.current_question]
+            self.questions[self.current_question].display
         ):
             return None
 
@@ -463,7 +388,7 @@ class Bot:
             # Get random unused answer
             available_answers = [
                 i
-                for i in range(len(self.oppo_answers[self.current_question]))
+                for i in range(len(self.questions[self.current_question].display))
                 if i not in self.answers_used
             ]
 
@@ -479,7 +404,7 @@ class Bot:
     def draw_output(self, screen, output):
         if self.timer > 0 or output is not None:
             if output is not None:
-                self.last_output = self.oppo_answers[self.current_question][output]
+                self.last_output = self.questions[self.current_question].display[output]
             temp_str = f"Opponent: {self.last_output}"
             test_font = pygame.font.Font(None, 28)
             text_width, text_height = test_font.size(temp_str)
@@ -501,7 +426,27 @@ class Bot:
 
 
 class Game_UI:
-    def __init__(self):
+    def __init__(
+        self,
+        question_pack: str = None,
+        metrics_path: str = None,
+        match_mode: str = "substring",
+    ):
+        """
+        Args:
+            question_pack (str, optional): Question pack file to play offline from. Defaults to None, which generates questions online.
+            metrics_path (str, optional): File the metrics are written to on exit, Prometheus format if it ends in .prom. Defaults to None.
+            match_mode (str, optional): How guesses are judged, one of MATCH_MODES, can be switched on the menu before each game. Defaults to "substring".
+        """
+        self.metrics_path = metrics_path
+        self.match_mode = match_mode
+        # Verdicts of the current question set, keyed by question number
+        self.answer_memo = Answer_Memo()
+        registry.gauge(
+            "answer_memo_hit_ratio",
+            "Share of guesses whose match was memoized",
+            func=self.answer_memo.hit_ratio,
+        )
         pygame.init()
         self.clock = pygame.time.Clock()
         self.FPS = 60
@@ -521,6 +466,15 @@ class Game_UI:
             (self.SCREEN_WIDTH - 250) // 2, self.SCREEN_HEIGHT - 80, 250, 50, "PvE mode"
         )
         self.to_menu_button = Button((self.SCREEN_WIDTH - 250) // 4, 500, 250, 50)
+        self.match_button = Button((self.SCREEN_WIDTH - 250) // 2, 40, 250, 40)
+        self.match_sign = Text_Block(
+            (self.SCREEN_WIDTH - 250) // 2,
+            40,
+            250,
+            40,
+            MATCH_MODE_NAMES[match_mode],
+            font_size=28,
+        )
         self.to_menu_sign = Text_Block(
             (self.SCREEN_WIDTH - 250) // 2, 500, 250, 50, "Return to Menu"
         )
@@ -537,26 +491,62 @@ class Game_UI:
             os.path.join("images", "background.png")
         ).convert_alpha()
 
+        if question_pack is not None:  # Offline, sets are picked from the pack
+            self.question_pack = Question_Pack(question_pack)
+            self.prefetcher = Question_Prefetcher(self.question_pack.get_questions)
+            self.question_pool = Question_Pool(self.question_pack.get_questions)
+            self.themes = [theme for theme in self.question_pack.themes() if theme]
+        else:
+            self.question_pack = None
+            # Stream the first question set in the background while the menu is shown
+            self.prefetcher = Question_Prefetcher(
+                Question_Generator.get_questions,
+                stream_func=Question_Generator.stream_questions,
+            )
+            # Keep complete sets ready for the games after that, from the cache shard of
+            # each theme first. Two workers so one slow theme does not hold up the next
+            self.question_pool = Question_Pool(
+                Question_Generator.get_questions,
+                batch_func=Question_Generator.get_question_sets,
+                num_workers=2,
+            )
+            self.themes = THEMES
+        self.prefetcher.request()
+        self.question_pool.add_theme(None)
+        self.question_pool.start()
+
+        # Theme picker above the PvE button, which plays without a theme
+        self.theme_scroll = 0  # Index of the first theme shown
+        self.warm_themes = set()  # Themes the pool keeps sets ready for
+        row_width = VISIBLE_THEMES * 140 + (VISIBLE_THEMES - 1) * 10
+        row_x = (self.SCREEN_WIDTH - row_width) // 2
+        self.theme_buttons = list()
+        self.theme_signs = list()
+        for i in range(min(VISIBLE_THEMES, len(self.themes))):
+            x = row_x + i * 150
+            self.theme_buttons.append(Button(x, 440, 140, 40))
+            self.theme_signs.append(
+                Text_Block(x, 440, 140, 40, self.themes[i], font_size=28)
+            )
+        self.scroll_buttons = (
+            Button(row_x - 40, 440, 30, 40),
+            Button(row_x + row_width + 10, 440, 30, 40),
+        )
+        self.scroll_signs = (
+            Text_Block(row_x - 40, 440, 30, 40, "<", font_size=28),
+            Text_Block(row_x + row_width + 10, 440, 30, 40, ">", font_size=28),
+        )
+
         # Game state
         self.reset_game()
 
     def reset_game(self):
         """Reset all game state variables"""
-        self.screen.fill((0, 0, 0))
-        loading_text = Text_Block(
-            (self.SCREEN_WIDTH - 250) // 2,
-            (self.SCREEN_HEIGHT - 50) // 2,
-            250,
-            50,
-            "Game Loading... Please wait",
-            txt_color=(255, 255, 255),
-        )
-        loading_text.txt_render(
-            self.screen, (self.SCREEN_WIDTH - 250) // 2, (self.SCREEN_HEIGHT - 50) // 2
-        )
-        pygame.display.flip()
-
-        self.questions, self.oppo_answers = Question_Generator.get_questions()
+        self.theme = None  # Theme of the game, None for any
+        self.start_clicked_at = 0
+        self.set_source = None  # Where the question set came from, for the metrics
+        self.questions = None  # list of Question
+        self.question_stream = None  # Partial_Set the questions are streamed into
         self.current_question = -1
         self.player_score = 0
         self.oppo_score = 0
@@ -566,10 +556,13 @@ class Game_UI:
         self.feedback_text = ""
         self.feedback_timer = 0
         self.show_menu = True
+        self.show_loading = False
         self.show_scoreboard = False
         self.question_start_time = 0
+        self.answer_keys = ()  # Answer_Keys of the current question
+        self.matcher = None  # Answer_Automaton of the current question
         self.user_input = ""
-        self.bot = Bot(self.oppo_answers, self.oppo_sprite)
+        self.bot = Bot(None, self.oppo_sprite)
         self.audience = Audience()
 
     def run(self):
@@ -582,6 +575,12 @@ class Game_UI:
             self.render()
             pygame.display.flip()
 
+        self.question_pool.stop()
+        shutdown_clients()  # Close kept-alive connections
+        if self.metrics_path is not None:
+            registry.dump(self.metrics_path)
+        if self.question_pack is not None:
+            self.question_pack.close()
         pygame.quit()
         sys.exit()
 
@@ -592,7 +591,11 @@ class Game_UI:
                 return False
 
             # Handle input block events
-            if not self.show_menu and not self.show_scoreboard:
+            if (
+                not self.show_menu
+                and not self.show_loading
+                and not self.show_scoreboard
+            ):
                 result = self.input_block.handle_event(event)
                 if result is not None:
                     self.user_input = result
@@ -602,10 +605,17 @@ class Game_UI:
                         result, bg_color=(255, 125, 125), txt_color=(250, 10, 10)
                     )  # pink, red
 
+            if event.type == pygame.MOUSEWHEEL and self.show_menu:
+                self.scroll_themes(-event.y)
+
             # Handle button clicks
             if event.type == pygame.MOUSEBUTTONDOWN and event.button == 1:
                 if self.show_menu and self.PvE_button.is_clicked(event.pos, True):
                     self.start_game()
+                elif self.show_menu and self.match_button.is_clicked(event.pos, True):
+                    self.switch_match_mode()
+                elif self.show_menu:
+                    self.handle_theme_click(event.pos)
                 elif self.show_scoreboard and self.to_menu_button.is_clicked(
                     event.pos, True
                 ):
@@ -613,11 +623,81 @@ class Game_UI:
 
         return True
 
-    def start_game(self):
-        """Start a new game"""
+    def switch_match_mode(self):
+        """Judge the guesses of the next games with the next mode of MATCH_MODES"""
+        i = MATCH_MODES.index(self.match_mode)
+        self.match_mode = MATCH_MODES[(i + 1) % len(MATCH_MODES)]
+        self.match_sign.update_text(MATCH_MODE_NAMES[self.match_mode])
+
+    def handle_theme_click(self, pos):
+        """Start a game of the clicked theme or scroll the picker"""
+        for i, button in enumerate(self.theme_buttons):
+            if button.is_clicked(pos, True):
+                self.start_game(self.themes[self.theme_scroll + i])
+                return
+        for step, button in zip((-1, 1), self.scroll_buttons):
+            if button.is_clicked(pos, True):
+                self.scroll_themes(step)
+                return
+
+    def scroll_themes(self, step: int):
+        """Move the theme picker by step themes, warm up the ones that come into view and not the others"""
+        last = max(len(self.themes) - len(self.theme_buttons), 0)
+        self.theme_scroll = min(max(self.theme_scroll + step, 0), last)
+        for i, sign in enumerate(self.theme_signs):
+            theme = self.themes[self.theme_scroll + i]
+            if sign.text != theme:
+                sign.update_text(theme)
+                self.warm_theme(theme)
+        visible = self.themes[
+            self.theme_scroll : self.theme_scroll + len(self.theme_signs)
+        ]
+        # Otherwise the pool keeps making LLM requests for every theme ever shown
+        for theme in self.warm_themes - set(visible) - {self.theme}:
+            self.warm_themes.discard(theme)
+            self.question_pool.remove_theme(theme)
+
+    def warm_theme(self, theme: str):
+        """Have the pool keep sets of theme ready, read from its cache shard in the background"""
+        if theme not in self.warm_themes:
+            self.warm_themes.add(theme)
+            self.question_pool.add_theme(theme)
+
+    def start_game(self, theme: str = None):
+        """Start a new game, or wait on the loading screen if questions are not ready yet"""
         self.PvE_button.activated = False
         self.show_menu = False
         self.show_scoreboard = False
+        self.theme = theme
+        self.start_clicked_at = time.perf_counter()
+        question_set = self.take_question_set()
+        if question_set is None:
+            self.show_loading = True
+            self.prefetcher.request(theme)
+            return
+        self.begin_game(question_set)
+
+    def take_question_set(self):
+        """Pop a ready set of the game's theme from the pool, or take the streamed one. Never blocks"""
+        question_set = self.question_pool.pop(self.theme)
+        if question_set is not None:
+            self.set_source = "pool"
+            return Partial_Set.from_result(question_set)
+        self.set_source = "prefetch"
+        return self.prefetcher.take_partial(self.theme)
+
+    def begin_game(self, question_set):
+        """Start the first question, the later ones may still be streaming into question_set"""
+        if self.show_loading:
+            self.set_source = "loading"  # Had to wait on the loading screen
+        game_start_seconds.observe(
+            time.perf_counter() - self.start_clicked_at, source=self.set_source
+        )
+        self.show_loading = False
+        self.question_stream = question_set
+        self.questions = question_set.questions
+        self.answer_memo.clear()  # Question numbers now mean other questions
+        self.bot.questions = self.questions
         self.start_new_question()
 
     def return_to_menu(self):
@@ -629,7 +709,19 @@ class Game_UI:
 
     def update(self):
         """Update game state"""
-        if not self.show_menu and not self.show_scoreboard:
+        if self.show_loading:
+            if self.questions is None:  # Waiting for the first question
+                self.prefetcher.poll()
+                question_set = self.take_question_set()
+                if question_set is not None:
+                    self.begin_game(question_set)
+            elif self.current_question < len(self.questions):  # Next question arrived
+                self.show_loading = False
+                self.begin_question()
+            elif self.question_stream.done:  # Stream failed, end with what was played
+                self.show_loading = False
+                self.show_scoreboard = True
+        elif not self.show_menu and not self.show_scoreboard:
             self.check_timer()
 
     def check_bot_answer(self):  # Let bot answer
@@ -638,13 +730,13 @@ class Game_UI:
         if bot_answer:
             self.bot.timer = 60
             self.bot.oppo_sprite.talk(
-                self.oppo_answers[self.current_question][bot_answer],
+                self.questions[self.current_question].display[bot_answer],
                 bg_color=(50, 160, 250),
                 txt_color=(10, 10, 250),
                 dir_right=False,
             )  # cyan, blue
             if bot_answer < 6 and self.answer_used[bot_answer] != 1:
-                points = self.questions[self.current_question]["points"][bot_answer]
+                points = self.questions[self.current_question].points[bot_answer]
                 self.oppo_score += points
                 self.answer_used[bot_answer] = 1
                 self.audience.react_to_answer("opponent")  # Add this line
@@ -658,6 +750,8 @@ class Game_UI:
 
         if self.show_menu:
             self.render_menu()
+        elif self.show_loading:
+            self.render_loading()
         elif self.show_scoreboard:
             self.render_scoreboard()
         else:
@@ -667,13 +761,20 @@ class Game_UI:
     def render_menu(self):
         """Render the main menu"""
         self.PvE_button.activated = True
-        self.PvE_sign.update_color(self.PvE_button.check_hover(pygame.mouse.get_pos()))
+        mouse_pos = pygame.mouse.get_pos()
+        self.PvE_sign.update_color(self.PvE_button.check_hover(mouse_pos))
         self.PvE_sign.blk_render(self.screen)
         self.PvE_sign.txt_render(
             self.screen,
             (self.SCREEN_WIDTH - 250) // 2 + 10,
             self.SCREEN_HEIGHT - 80 + 10,
         )
+        self.render_theme_picker(mouse_pos)
+        self.match_sign.update_color(self.match_button.check_hover(mouse_pos))
+        self.match_sign.blk_render(self.screen)
+        self.match_sign.txt_render(
+            self.screen, self.match_sign.rect.x, self.match_sign.rect.y
+        )
         player_image = pygame.image.load(
             os.path.join("images", "miku_idle.png")
         ).convert_alpha()
@@ -697,6 +798,40 @@ class Game_UI:
             self.screen, (self.SCREEN_WIDTH - 400) // 2, (self.SCREEN_HEIGHT - 200) // 2
         )
 
+    def render_theme_picker(self, mouse_pos):
+        """Render the theme buttons, a hovered theme is warmed up so a click starts right away"""
+        for i, (button, sign) in enumerate(zip(self.theme_buttons, self.theme_signs)):
+            hover = button.check_hover(mouse_pos)
+            if hover:
+                self.warm_theme(self.themes[self.theme_scroll + i])
+            sign.update_color(hover)
+            sign.blk_render(self.screen)
+            sign.txt_render(self.screen, sign.rect.x, sign.rect.y)
+        if len(self.themes) > len(self.theme_buttons):
+            for button, sign in zip(self.scroll_buttons, self.scroll_signs):
+                sign.update_color(button.check_hover(mouse_pos))
+                sign.blk_render(self.screen)
+                sign.txt_render(self.screen, sign.rect.x, sign.rect.y)
+
+    def render_loading(self):
+        """Render the loading screen while the question set is fetched"""
+        self.screen.fill((0, 0, 0))
+        if self.prefetcher.error is not None:
+            text = "Failed to load questions, retrying..."
+        else:
+            text = "Game Loading... Please wait"
+        loading_text = Text_Block(
+            (self.SCREEN_WIDTH - 250) // 2,
+            (self.SCREEN_HEIGHT - 50) // 2,
+            250,
+            50,
+            text,
+            txt_color=(255, 255, 255),
+        )
+        loading_text.txt_render(
+            self.screen, (self.SCREEN_WIDTH - 250) // 2, (self.SCREEN_HEIGHT - 50) // 2
+        )
+
     def render_game(self):
         """Render the game screen"""
         self.audience.update()  # Draw audience
@@ -719,15 +854,17 @@ class Game_UI:
             temp = Text_Block(x, y, 250, 50, text, txt_color=color)
             temp.txt_render(self.screen, x, y)
 
-        str_list = ["Question 1", "Question 2", "Question 3", "Total"]
-        y_list = [100, 200, 300, 400]
+        # Fewer rows if the question stream failed during the game
+        num_rows = len(self.player_hist) + 1
+        str_list = [f"Question {i + 1}" for i in range(num_rows - 1)] + ["Total"]
+        y_list = [100 * (i + 1) for i in range(num_rows)]
         x_left = (self.SCREEN_WIDTH - 250) // 4
         x_mid = (self.SCREEN_WIDTH - 250) // 4 * 2
         x_right = (self.SCREEN_WIDTH - 250) // 4 * 3
 
-        for i in range(4):
+        for i in range(num_rows):
 
-            if i == 3:  # Show total score
+            if i == num_rows - 1:  # Show total score
                 l_num = sum(self.player_hist)
                 r_num = sum(self.oppo_hist)
             else:
@@ -787,7 +924,7 @@ class Game_UI:
 
     # Game logic methods (kept similar to original but adapted for OOP)
     def draw_answer_hints(self):
-        remaining = len(self.questions[self.current_question]["answer"]) - sum(
+        remaining = len(self.questions[self.current_question].answers) - sum(
             self.answer_used
         )
         hint_text = f"Answers remaining: {remaining}"
@@ -798,22 +935,15 @@ class Game_UI:
         hint_block.txt_render(self.screen, 275, 142)
 
     def check_answer(self, player_input: str):
-        player_input = player_input.lower().replace(" ", "")
-        if not player_input:
+        guess = Guess(player_input)  # Normalized once for all answers
+        if not guess.text:
             self.feedback_text = "Please enter an answer!"
             return False
 
-        max_score = -1
-        for i, answer in enumerate(self.questions[self.current_question]["answer"]):
-            substring = longest_common_substring(player_input, answer)
-            score = len(substring) / len(answer)
-            if score > max_score:
-                max_score = score
-                index = i
-
-        if max_score >= 0.8:
+        index, max_score = self.match_answer(guess)
+        if max_score >= MATCH_THRESHOLD:
             if self.answer_used[index] != 1:
-                points = self.questions[self.current_question]["points"][index]
+                points = self.questions[self.current_question].points[index]
                 self.player_score += points
                 self.answer_used[index] = 1
                 self.feedback_text = f"Correct! +{points} points"
@@ -826,21 +956,37 @@ class Game_UI:
             self.feedback_text = "Wrong answer!"
             return False
 
+    def match_answer(self, guess: Guess) -> tuple[int, float]:
+        """Index and score of the best answer of the current question, memoized"""
+        verdict = self.answer_memo.get(self.current_question, guess.text)
+        if verdict is not None:
+            return verdict
+        if self.match_mode == "edit":
+            # Bit-parallel edit distance, a few integer operations per character
+            scores = [key.edit_score(guess) for key in self.answer_keys]
+            max_score = max(scores, default=-1)
+            index = scores.index(max_score) if scores else -1
+        else:
+            # One pass over the guess scores it against every answer. With only a
+            # question's answers that beats shortlisting them by trigrams first
+            scores = self.matcher.scores(guess)
+            max_score = max(scores, default=-1)
+            index = scores.index(max_score) if scores else -1
+        self.answer_memo.put(self.current_question, guess.text, index, max_score)
+        return (index, max_score)
+
     def draw_answers(self):
         answer_y = 180
-        for i, (answer, points) in enumerate(
-            zip(
-                self.questions[self.current_question]["answer"],
-                self.questions[self.current_question]["points"],
-            )
-        ):
+        question = self.questions[self.current_question]
+        # Only the scored answers have points, zip stops there
+        for i, (answer, points) in enumerate(zip(question.display, question.points)):
             if self.answer_used[i] == 1:
                 answer_block = Text_Block(
                     100,
                     answer_y,
                     600,
                     40,
-                    f"{self.oppo_answers[self.current_question][i]} ({points} pts)",
+                    f"{answer} ({points} pts)",
                     bg_color=(200, 255, 200),
                     font_size=24,
                 )
@@ -923,7 +1069,7 @@ class Game_UI:
         )
 
     def draw_question(self):
-        q_text = self.questions[self.current_question]["question"]
+        q_text = self.questions[self.current_question].text
         question_sign = Text_Block((self.SCREEN_WIDTH - 250) // 2, 100, 250, 50, q_text)
         question_sign.txt_render(self.screen, (self.SCREEN_WIDTH - 250) // 2, 100)
 
@@ -946,7 +1092,6 @@ class Game_UI:
             self.player_hist.append(self.player_score)
             self.oppo_hist.append(self.oppo_score)
 
-        self.question_start_time = pygame.time.get_ticks()
         self.player_score = 0
         self.oppo_score = 0
         self.answer_used = [0] * 6
@@ -954,9 +1099,22 @@ class Game_UI:
         self.input_block.text = ""
         self.player_sprite.text_duration = 0
         self.bot.oppo_sprite.text_duration = 0
-        self.bot.start_question(self.current_question)
-        if self.current_question >= 3:
+        if self.current_question >= 3 or (
+            self.question_stream.done and self.current_question >= len(self.questions)
+        ):
             self.show_scoreboard = True
+        elif self.current_question >= len(self.questions):
+            self.show_loading = True  # Question is still streaming in
+        else:
+            self.begin_question()
+
+    def begin_question(self):
+        """Start the timer and the bot of the current question"""
+        # Keys of the question in play only, the sets kept ready hold just the answers
+        self.answer_keys = self.questions[self.current_question].answer_keys()
+        self.matcher = Answer_Automaton(self.answer_keys)
+        self.question_start_time = pygame.time.get_ticks()
+        self.bot.start_question(self.current_question)
 
     def check_timer(self):
         elapsed_seconds = (pygame.time.get_ticks() - self.question_start_time) // 1000
@@ -964,25 +1122,24 @@ class Game_UI:
             self.start_new_question()
 
 
-def longest_common_substring(s1: str, s2: str) -> str:
-    """Find the longest common substring between two strings"""
-    m = [[0] * (len(s2) + 1) for _ in range(len(s1) + 1)]
-    longest = 0
-    end_pos = 0
-
-    for i in range(1, len(s1) + 1):
-        for j in range(1, len(s2) + 1):
-            if s1[i - 1].lower() == s2[j - 1].lower():
-                m[i][j] = m[i - 1][j - 1] + 1
-                if m[i][j] > longest:
-                    longest = m[i][j]
-                    end_pos = i
-            else:
-                m[i][j] = 0
-
-    return s1[end_pos - longest : end_pos] if longest > 0 else ""
-
-
 if __name__ == "__main__":
-    game = Game_UI()
+    parser = argparse.ArgumentParser(description="Guess Their Answer!")
+    parser.add_argument("--pack", help="play offline from a question pack")
+    parser.add_argument(
+        "--json", action="store_true", help="ask the LLM for JSON instead of free text"
+    )
+    parser.add_argument(
+        "--metrics", help="write metrics here on exit, .prom for Prometheus format"
+    )
+    parser.add_argument(
+        "--match",
+        choices=MATCH_MODES,
+        default="substring",
+        help="how guesses are judged at first, edit distance forgives typos",
+    )
+    args = parser.parse_args()
+    Question_Generator.json_mode = args.json
+    game = Game_UI(
+        question_pack=args.pack, metrics_path=args.metrics, match_mode=args.match
+    )
     game.run()
@@ -0,0 +1,250 @@
+import math
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+
+class Deadline_Exceeded(TimeoutError):
+    """No request finished successfully before the deadline"""
+
+
+class Hedged_Fetcher:
+    """
+    Run a fetch with a deadline and hedging
+
+    If the request is still running after hedge_percentile of the recently observed
+    latencies, a second identical request is sent and whichever finishes first wins.
+    The other one is told to stop through its cancel event.
+
+    With a generator function as fetch_func, stream() hedges on the first item instead,
+    and the latencies are those of the first item.
+    """
+
+    def __init__(
+        self,
+        fetch_func,
+        validate=None,
+        deadline: float = 20,
+        hedge_percentile: float = 90,
+        default_hedge_delay: float = 8,
+        min_samples: int = 5,
+        window: int = 50,
+        max_workers: int = 4,
+    ):
+        """
+        Args:
+            fetch_func (callable): Called as fetch_func(*args, cancel_event=event), should stop early once the event is set
+            validate (callable, optional): Called on a result, a falsy return value counts as a failed request. Defaults to None.
+            deadline (float, optional): Seconds until fetch() gives up. Defaults to 20.
+            hedge_percentile (float, optional): Latency percentile after which the hedged request is sent. Defaults to 90.
+            default_hedge_delay (float, optional): Hedge delay in seconds until min_samples latencies are observed. Defaults to 8.
+            min_samples (int, optional): Latencies needed before the percentile is used. Defaults to 5.
+            window (int, optional): Number of recent latencies kept. Defaults to 50.
+            max_workers (int, optional): Threads running requests. Defaults to 4.
+        """
+        self.fetch_func = fetch_func
+        self.validate = validate
+        self.deadline = deadline
+        self.hedge_percentile = hedge_percentile
+        self.default_hedge_delay = default_hedge_delay
+        self.min_samples = min_samples
+        self.requests = 0  # Calls of fetch()
+        self.hedges = 0  # Hedged requests sent
+        self.hedge_wins = 0  # Hedged requests that finished first
+        self.deadline_misses = 0  # Calls of fetch() that failed
+        self._latencies = deque(maxlen=window)  # Seconds of successful requests
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers)
+
+    def hedge_delay(self) -> float:
+        """Seconds to wait for the first request before sending the hedged one"""
+        with self._lock:
+            latencies = sorted(self._latencies)
+        if len(latencies) < self.min_samples:
+            return self.default_hedge_delay
+        index = math.ceil(self.hedge_percentile / 100 * len(latencies)) - 1
+        return latencies[min(max(index, 0), len(latencies) - 1)]
+
+    def fetch(self, *args, deadline: float = None):
+        """
+        Fetch with hedging, blocks until a result arrives or the deadline passes
+
+        Args:
+            deadline (float, optional): Overrides the default deadline in seconds. Defaults to None.
+
+        Raises:
+            Deadline_Exceeded: Every request failed or none finished in time
+        """
+        if deadline is None:
+            deadline = self.deadline
+        self.requests += 1
+        start = time.monotonic()
+        attempts = dict()  # future -> (cancel event, is hedged request)
+        self._submit(attempts, args, hedged=False)
+
+        hedge_at = self.hedge_delay()
+        hedge_sent = False
+        last_error = None
+        try:
+            while True:
+                elapsed = time.monotonic() - start
+                if elapsed >= deadline:
+                    break
+                # Hedge when the first request is too slow, or retry at once if it failed
+                if not hedge_sent and (elapsed >= hedge_at or not attempts):
+                    hedge_sent = True
+                    self.hedges += 1
+                    self._submit(attempts, args, hedged=True)
+                if not attempts:  # Both requests failed
+                    break
+
+                wait_until = deadline if hedge_sent else min(hedge_at, deadline)
+                done, _ = wait(
+                    list(attempts),
+                    timeout=wait_until - elapsed,
+                    return_when=FIRST_COMPLETED,
+                )
+                for future in done:
+                    _, hedged = attempts.pop(future)
+                    if future.exception() is not None:
+                        last_error = future.exception()
+                        continue
+                    result = future.result()
+                    if self.validate is not None and not self.validate(result):
+                        last_error = ValueError("Invalid result")
+                        continue
+                    if hedged:
+                        self.hedge_wins += 1
+                    return result
+        finally:
+            for cancel_event, _ in attempts.values():  # Stop the losers
+                cancel_event.set()
+
+        self.deadline_misses += 1
+        raise Deadline_Exceeded(
+            f"No result within {deadline:.1f}s"
+            + (f", last error: {last_error!r}" if last_error is not None else "")
+        ) from last_error
+
+    def stream(self, *args, deadline: float = None):
+        """
+        Stream with hedging, yields the items of whichever request yields first
+
+        Only the wait for the first item is bounded and hedged. After that the winner is
+        followed to its end and the other request is told to stop.
+
+        Args:
+            deadline (float, optional): Overrides the default deadline for the first item in seconds. Defaults to None.
+
+        Raises:
+            Deadline_Exceeded: Every request failed or none yielded in time
+        """
+        if deadline is None:
+            deadline = self.deadline
+        self.requests += 1
+        start = time.monotonic()
+        items = queue.Queue()  # (cancel event, kind, value) from every request
+        attempts = dict()  # cancel event -> (start time, is hedged request)
+        self._submit_stream(attempts, items, args, hedged=False)
+
+        hedge_at = self.hedge_delay()
+        hedge_sent = False
+        last_error = None
+        winner = None
+        try:
+            while winner is None:
+                elapsed = time.monotonic() - start
+                if elapsed >= deadline:
+                    break
+                if not hedge_sent and (elapsed >= hedge_at or not attempts):
+                    hedge_sent = True
+                    self.hedges += 1
+                    self._submit_stream(attempts, items, args, hedged=True)
+                if not attempts:  # Both requests failed
+                    break
+
+                wait_until = deadline if hedge_sent else min(hedge_at, deadline)
+                try:
+                    cancel_event, kind, value = items.get(timeout=wait_until - elapsed)
+                except queue.Empty:
+                    continue
+                if kind == "item":
+                    winner = cancel_event
+                    attempt_start, hedged = attempts[winner]
+                    with self._lock:
+                        self._latencies.append(time.monotonic() - attempt_start)
+                    if hedged:
+                        self.hedge_wins += 1
+                    for other in attempts:  # Stop the loser
+                        if other is not winner:
+                            other.set()
+                    yield value
+                elif cancel_event in attempts:
+                    attempts.pop(cancel_event)
+                    last_error = value or ValueError("Stream ended without an item")
+
+            while winner is not None:
+                cancel_event, kind, value = items.get()
+                if cancel_event is not winner:
+                    continue
+                if kind == "error":
+                    raise value
+                if kind == "done":
+                    return
+                yield value
+        finally:
+            for cancel_event in attempts:  # Also stops the winner if closed early
+                cancel_event.set()
+
+        self.deadline_misses += 1
+        raise Deadline_Exceeded(
+            f"No item within {deadline:.1f}s"
+            + (f", last error: {last_error!r}" if last_error is not None else "")
+        ) from last_error
+
+    def stats(self) -> dict:
+        return {
+            "requests": self.requests,
+            "hedges": self.hedges,
+            "hedge_wins": self.hedge_wins,
+            "deadline_misses": self.deadline_misses,
+            "hedge_delay": self.hedge_delay(),
+        }
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def _submit(self, attempts, args, hedged):
+        cancel_event = threading.Event()
+        future = self._executor.submit(self._attempt, args, cancel_event)
+        attempts[future] = (cancel_event, hedged)
+
+    def _submit_stream(self, attempts, items, args, hedged):
+        cancel_event = threading.Event()
+        attempts[cancel_event] = (time.monotonic(), hedged)
+        self._executor.submit(self._stream_attempt, args, cancel_event, items)
+
+    def _stream_attempt(self, args, cancel_event, items):
+        try:
+            stream = self.fetch_func(*args, cancel_event=cancel_event)
+            try:
+                for item in stream:
+                    if cancel_event.is_set():
+                        break
+                    items.put((cancel_event, "item", item))
+            finally:
+                stream.close()
+        except Exception as e:
+            items.put((cancel_event, "error", e))
+        else:
+            items.put((cancel_event, "done", None))
+
+    def _attempt(self, args, cancel_event):
+        start = time.monotonic()
+        result = self.fetch_func(*args, cancel_event=cancel_event)
+        if not cancel_event.is_set():  # Latency of cancelled requests means nothing
+            with self._lock:
+                self._latencies.append(time.monotonic() - start)
+        return result
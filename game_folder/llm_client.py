@@ -0,0 +1,124 @@
+import atexit
+import os
+import threading
+
+# openai, httpx and dotenv are imported on the first get_client call. The openai SDK
+# alone takes about half a second to import, and the first fetch happens on a
+# background thread, so the menu opens without waiting for it.
+
+AZURE_ENDPOINT = "https://cuhk-apip.azure-api.net"
+API_VERSION = "2024-06-01"
+
+
+class Client_Registry:
+    """
+    Process-wide AzureOpenAI clients
+
+    A client is created on first use and then reused, so its HTTP connections stay alive
+    between games and only the first request pays for the TLS handshake.
+    """
+
+    def __init__(
+        self,
+        max_connections: int = 10,
+        max_keepalive_connections: int = 5,
+        keepalive_expiry: float = 120,
+        timeout: float = 60,
+        max_retries: int = 2,
+    ):
+        """
+        Args:
+            max_connections (int, optional): Maximum open connections per client. Defaults to 10.
+            max_keepalive_connections (int, optional): Idle connections kept open per client. Defaults to 5.
+            keepalive_expiry (float, optional): Seconds an idle connection is kept open. Defaults to 120.
+            timeout (float, optional): Request timeout in seconds. Defaults to 60.
+            max_retries (int, optional): Retries of failed requests done by the SDK, 429s included. Defaults to 2.
+        """
+        self.max_connections = max_connections
+        self.max_keepalive_connections = max_keepalive_connections
+        self.keepalive_expiry = keepalive_expiry
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self._clients = dict()  # (endpoint, api_version, api_key) -> AzureOpenAI
+        self._lock = threading.Lock()
+        self._env_loaded = False
+
+    def configure(self, **kwargs):
+        """Change pool settings, existing clients are closed and recreated on next use"""
+        for key, value in kwargs.items():
+            if key not in (
+                "max_connections",
+                "max_keepalive_connections",
+                "keepalive_expiry",
+                "timeout",
+                "max_retries",
+            ):
+                raise TypeError(f"Unknown client setting: {key}")
+            setattr(self, key, value)
+        self.shutdown()
+
+    def get_client(
+        self,
+        endpoint: str = AZURE_ENDPOINT,
+        api_version: str = API_VERSION,
+        api_key: str = None,
+    ):
+        """
+        Return the shared client of an endpoint, creating it on first use
+
+        Returns:
+            openai.AzureOpenAI: The client
+        """
+        with self._lock:
+            if not self._env_loaded:
+                from dotenv import load_dotenv
+
+                load_dotenv()
+                self._env_loaded = True
+            if api_key is None:
+                api_key = os.getenv("AZURE_API_KEY")
+
+            key = (endpoint, api_version, api_key)
+            client = self._clients.get(key)
+            if client is None:
+                import httpx
+                from openai import AzureOpenAI
+
+                http_client = httpx.Client(
+                    limits=httpx.Limits(
+                        max_connections=self.max_connections,
+                        max_keepalive_connections=self.max_keepalive_connections,
+                        keepalive_expiry=self.keepalive_expiry,
+                    ),
+                    timeout=self.timeout,
+                )
+                client = AzureOpenAI(
+                    azure_endpoint=endpoint,
+                    api_version=api_version,
+                    api_key=api_key,
+                    http_client=http_client,
+                    max_retries=self.max_retries,
+                )
+                self._clients[key] = client
+            return client
+
+    def shutdown(self):
+        """Close all clients and their connections"""
+        with self._lock:
+            clients = list(self._clients.values())
+            self._clients.clear()
+        for client in clients:
+            client.close()
+
+
+registry = Client_Registry()
+atexit.register(registry.shutdown)
+
+
+def get_client(**kwargs):
+    """Return a client from the process-wide registry"""
+    return registry.get_client(**kwargs)
+
+
+def shutdown():
+    registry.shutdown()
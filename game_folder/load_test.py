@@ -0,0 +1,171 @@
+"""
+Load test the question pipeline against a local fake LLM server, no network needed
+
+Every request goes through Question_Generator.get_questions, so hedging, streaming,
+parsing and the cache are all exercised. The cache is a temporary file, the real one
+is left alone.
+
+Usage:
+    python load_test.py --recordings recordings.jsonl --requests 200 --concurrency 8
+    python load_test.py --pack questions.pack --latency 2 --spike-rate 0.05 --seed 1
+    python load_test.py --pack questions.pack --bulk 6 --error-rate 0.5 --error-status 429
+"""
+
+import argparse
+import os
+import random
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import bulk_generate
+from fake_llm_server import Fake_LLM_Server
+from question_backend import (
+    Azure_Backend,
+    format_completion,
+    load_recordings,
+    set_backend,
+)
+from question_cache import Question_Cache, set_default_cache
+from question_dedup import get_default_index
+from question_generator import Question_Generator, backend_breaker, hedged_fetcher
+from question_json import format_json_completion
+from metrics import registry
+from question_pack import Question_Pack
+
+
+def pack_completions(
+    path: str, count: int, seed: int = None, json_mode: bool = False
+) -> list[str]:
+    """Write count random responses from the questions of a pack"""
+    rng = random.Random(seed)
+    write = format_json_completion if json_mode else format_completion
+    with Question_Pack(path) as pack:
+        return [write(*pack.get_questions(rng=rng)) for _ in range(count)]
+
+
+def percentile(values: list[float], percent: float) -> float:
+    if not values:
+        return 0
+    values = sorted(values)
+    return values[min(int(percent / 100 * len(values)), len(values) - 1)]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load test the question pipeline")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--recordings", help="JSONL file of recorded completions")
+    source.add_argument("--pack", help="question pack to make completions from")
+    parser.add_argument("--requests", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--themes", nargs="*", default=[None])
+    parser.add_argument("--no-cache", action="store_true", help="bypass the cache")
+    parser.add_argument(
+        "--json", action="store_true", help="JSON mode, needs JSON recordings"
+    )
+    parser.add_argument(
+        "--dedup",
+        action="store_true",
+        help="replace repeated questions, replayed recordings repeat a lot",
+    )
+    parser.add_argument("--latency", type=float, default=0.5)
+    parser.add_argument("--jitter", type=float, default=0.5)
+    parser.add_argument("--spike-rate", type=float, default=0)
+    parser.add_argument("--spike-latency", type=float, default=10)
+    parser.add_argument("--chunk-delay", type=float, default=0.01)
+    parser.add_argument("--error-rate", type=float, default=0)
+    parser.add_argument("--error-status", type=int, default=500)
+    parser.add_argument("--seed", type=int)
+    parser.add_argument(
+        "--metrics", help="write the metrics here, .prom for Prometheus format"
+    )
+    parser.add_argument(
+        "--bulk",
+        type=int,
+        metavar="GAMES",
+        help="run bulk_generate for GAMES games per theme instead of single requests",
+    )
+    args = parser.parse_args(argv)
+
+    if args.recordings is not None:
+        completions = load_recordings(args.recordings)
+    else:
+        completions = pack_completions(args.pack, 50, args.seed, args.json)
+
+    server = Fake_LLM_Server(
+        completions,
+        latency=args.latency,
+        latency_jitter=args.jitter,
+        spike_rate=args.spike_rate,
+        spike_latency=args.spike_latency,
+        chunk_delay=args.chunk_delay,
+        error_rate=args.error_rate,
+        error_status=args.error_status,
+        seed=args.seed,
+    )
+    cache_dir = tempfile.mkdtemp()
+    cache = Question_Cache(os.path.join(cache_dir, "load_test.db"))
+    set_default_cache(cache)
+    set_backend(Azure_Backend(endpoint=server.url, api_key="fake"))
+    Question_Generator.json_mode = args.json
+    Question_Generator.dedup = args.dedup
+
+    latencies = list()
+    failures = list()
+
+    def one_request(i):
+        theme = args.themes[i % len(args.themes)]
+        start = time.perf_counter()
+        try:
+            Question_Generator.get_questions(theme, use_cache=not args.no_cache)
+        except Exception as e:
+            failures.append(e)
+            return
+        latencies.append(time.perf_counter() - start)
+
+    with server:
+        start = time.perf_counter()
+        if args.bulk is not None:
+            # 429s must slow the job down, not open the circuit breaker and stop it
+            bulk_generate.main(
+                [theme or "any" for theme in args.themes]
+                + ["--games", str(args.bulk), "--games-per-request", "2"]
+                + ["--pack", os.path.join(cache_dir, "bulk.pack")]
+                + ["--concurrency", str(args.concurrency), "--rpm", "600"]
+                + ([] if args.dedup else ["--no-dedup"])
+            )
+        else:
+            with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+                list(executor.map(one_request, range(args.requests)))
+        elapsed = time.perf_counter() - start
+
+    if args.bulk is not None:
+        print(f"bulk run in {elapsed:.2f}s")
+    else:
+        print(f"{args.requests} requests in {elapsed:.2f}s")
+        print(f"  ok {len(latencies)}, failed {len(failures)}")
+        for percent in (50, 90, 99):
+            print(f"  p{percent} {percentile(latencies, percent) * 1000:.0f} ms")
+    print(f"  server {server.stats()}")
+    print(f"  hedging {hedged_fetcher.stats()}")
+    print(f"  breaker {backend_breaker.stats()}")
+    print(f"  cache {cache.stats()}")
+    if args.dedup:
+        print(f"  dedup {get_default_index().stats()}")
+    first_token = registry.get("llm_time_to_first_token_seconds")
+    print(
+        "  time to first token (bucket bounds)"
+        f" p50 {first_token.percentile(50, mode='stream')}s,"
+        f" p90 {first_token.percentile(90, mode='stream')}s"
+    )
+    if args.metrics is not None:
+        registry.dump(args.metrics)
+    set_default_cache(None)
+    hedged_fetcher.shutdown()
+    for name in os.listdir(cache_dir):
+        os.remove(os.path.join(cache_dir, name))
+    os.rmdir(cache_dir)
+
+
+if __name__ == "__main__":
+    main()
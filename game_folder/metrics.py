@@ -0,0 +1,245 @@
+import bisect
+import json
+import math
+import threading
+import time
+from contextlib import contextmanager
+
+# Seconds, from a cache hit to a slow LLM response
+DEFAULT_BUCKETS = (0.005, 0.025, 0.1, 0.25, 0.5, 1, 2, 4, 8, 16, 32)
+
+
+class Metric:
+    """A named value for each combination of label values"""
+
+    kind = None  # Prometheus metric type
+
+    def __init__(self, name: str, help: str):
+        self.name = name
+        self.help = help
+        self._lock = threading.Lock()
+        self._values = dict()  # sorted ((label, value), ...) -> value
+
+    def samples(self) -> list[tuple[str, dict, float]]:
+        """(name with suffix, labels, value) of every exported sample"""
+        with self._lock:
+            return [
+                (self.name, dict(key), value) for key, value in self._values.items()
+            ]
+
+    def to_dict(self):
+        return {
+            "type": self.kind,
+            "help": self.help,
+            "values": [
+                {"labels": labels, "value": value}
+                for _, labels, value in self.samples()
+            ],
+        }
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        with self._lock:
+            return self._values.get(tuple(sorted(labels.items())), 0)
+
+
+class Gauge(Metric):
+    """Set directly, or read from func when exported"""
+
+    kind = "gauge"
+
+    def __init__(self, name: str, help: str, func=None):
+        super().__init__(name, help)
+        self.func = func
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[tuple(sorted(labels.items()))] = value
+
+    def samples(self):
+        if self.func is not None:
+            return [(self.name, dict(), float(self.func()))]
+        return super().samples()
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                # Count per bucket and one for above the last, sum, count
+                entry = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            entry[0][bisect.bisect_left(self.buckets, value)] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        """Observe the seconds spent in the with block"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def percentile(self, percent: float, **labels) -> float:
+        """Upper bound of the bucket holding the percentile, inf if above the last bucket"""
+        with self._lock:
+            entry = self._values.get(tuple(sorted(labels.items())))
+            if entry is None or not entry[2]:
+                return 0.0
+            counts, _, count = entry
+            rank = math.ceil(percent / 100 * count)
+            seen = 0
+            for bound, bucket_count in zip(self.buckets + (math.inf,), counts):
+                seen += bucket_count
+                if seen >= rank:
+                    return bound
+            return math.inf
+
+    def samples(self):
+        with self._lock:
+            entries = [(dict(key), entry) for key, entry in self._values.items()]
+        samples = list()
+        for labels, (counts, total, count) in entries:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (math.inf,), counts):
+                cumulative += bucket_count
+                le = "+Inf" if bound == math.inf else repr(float(bound))
+                samples.append((self.name + "_bucket", dict(labels, le=le), cumulative))
+            samples.append((self.name + "_sum", labels, total))
+            samples.append((self.name + "_count", labels, count))
+        return samples
+
+    def to_dict(self):
+        with self._lock:
+            entries = [(dict(key), entry) for key, entry in self._values.items()]
+        return {
+            "type": self.kind,
+            "help": self.help,
+            "buckets": list(self.buckets),
+            "values": [
+                {
+                    "labels": labels,
+                    "counts": list(counts),
+                    "sum": total,
+                    "count": count,
+                }
+                for labels, (counts, total, count) in entries
+            ],
+        }
+
+
+class Metrics_Registry:
+    """
+    In-process metrics, dumped as JSON or in the Prometheus text format
+
+    Getting a metric that is already registered returns the same object, so modules
+    can declare the metrics they update at import time.
+    """
+
+    def __init__(self):
+        self._metrics = dict()  # name -> Metric
+        self._lock = threading.Lock()
+
+    def counter(self, name: str, help: str = "") -> Counter:
+        return self._get(Counter, name, help)
+
+    def gauge(self, name: str, help: str = "", func=None) -> Gauge:
+        """
+        Args:
+            func (callable, optional): Called without arguments on export for the current value. Defaults to None.
+        """
+        gauge = self._get(Gauge, name, help)
+        if func is not None:
+            gauge.func = func
+        return gauge
+
+    def histogram(
+        self, name: str, help: str = "", buckets=DEFAULT_BUCKETS
+    ) -> Histogram:
+        return self._get(Histogram, name, help, buckets=buckets)
+
+    def get(self, name: str) -> Metric:
+        with self._lock:
+            return self._metrics[name]
+
+    def to_dict(self) -> dict:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return {metric.name: metric.to_dict() for metric in metrics}
+
+    def to_json(self) -> str:
+        return json.dumps(self.to_dict(), indent=2)
+
+    def to_prometheus(self) -> str:
+        """The Prometheus text exposition format"""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = list()
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {escape_help(metric.help)}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for name, labels, value in metric.samples():
+                lines.append(f"{name}{format_labels(labels)} {format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+    def dump(self, path: str):
+        """Write to path, in the Prometheus format if it ends in .prom, JSON otherwise"""
+        text = self.to_prometheus() if path.endswith(".prom") else self.to_json()
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(text)
+
+    def _get(self, cls, name, help, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, help, **kwargs)
+            elif not isinstance(metric, cls):
+                raise TypeError(f"{name} is already a {metric.kind}")
+            return metric
+
+
+def escape_help(text: str) -> str:
+    return text.replace("\\", "\\\\").replace("\n", "\\n")
+
+
+def format_labels(labels: dict) -> str:
+    if not labels:
+        return ""
+    parts = list()
+    for key, value in labels.items():
+        value = (
+            str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        )
+        parts.append(f'{key}="{value}"')
+    return "{" + ",".join(parts) + "}"
+
+
+def format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    if value == -math.inf:
+        return "-Inf"
+    if value != value:
+        return "NaN"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+# Process-wide registry the question pipeline reports to
+registry = Metrics_Registry()
@@ -0,0 +1,340 @@
+import abc
+import json
+import random
+import threading
+import time
+
+from llm_client import API_VERSION, AZURE_ENDPOINT, get_client
+from metrics import registry
+from question_json import format_json_completion
+
+request_seconds = registry.histogram(
+    "llm_request_seconds", "Seconds from sending a request to the end of its response"
+)
+first_token_seconds = registry.histogram(
+    "llm_time_to_first_token_seconds",
+    "Seconds from sending a request to its first text",
+)
+llm_requests = registry.counter("llm_requests_total", "LLM requests by outcome")
+llm_tokens = registry.counter(
+    "llm_tokens_total",
+    "Prompt and completion tokens, estimated from the text if the response has no usage",
+)
+llm_bytes = registry.counter(
+    "llm_response_bytes_total", "UTF-8 bytes of response text received"
+)
+
+
+class Question_Backend(abc.ABC):
+    """
+    Source of LLM completions for Question_Generator
+
+    A backend returns the response text in the format asked for by the prompt, so the
+    parser and the cache are exercised the same way whichever backend is used.
+    """
+
+    @abc.abstractmethod
+    def stream_completion(
+        self,
+        messages: list[dict],
+        theme: str = None,
+        num_questions: int = 3,
+        timeout: float = None,
+        json_mode: bool = False,
+    ):
+        """
+        Stream the response to messages
+
+        Args:
+            messages (list[dict]): Chat messages built by Question_Generator.build_messages
+            theme (str, optional): Theme the messages ask for. Defaults to None.
+            num_questions (int, optional): Number of questions the messages ask for. Defaults to 3.
+            timeout (float, optional): Request timeout in seconds, None for the default. Defaults to None.
+            json_mode (bool, optional): Respond with JSON matching QUESTION_SET_SCHEMA instead of text. Defaults to False.
+
+        Yields:
+            str: Chunks of the response text
+        """
+        raise NotImplementedError
+
+    def completion(
+        self,
+        messages: list[dict],
+        theme: str = None,
+        num_questions: int = 3,
+        timeout: float = None,
+        json_mode: bool = False,
+    ) -> str:
+        """Same as stream_completion, but returns the whole response text"""
+        return "".join(
+            self.stream_completion(
+                messages, theme, num_questions, timeout=timeout, json_mode=json_mode
+            )
+        )
+
+    def close(self):
+        pass
+
+
+class Azure_Backend(Question_Backend):
+    """
+    Azure OpenAI chat completions, through the shared clients of llm_client
+
+    Also talks to a Fake_LLM_Server when endpoint is its url.
+    """
+
+    def __init__(
+        self,
+        endpoint: str = AZURE_ENDPOINT,
+        api_version: str = API_VERSION,
+        api_key: str = None,
+        model: str = "gpt-4o",
+        temperature: float = 0.9,
+        record_path: str = None,
+    ):
+        """
+        Args:
+            endpoint (str, optional): Endpoint url. Defaults to AZURE_ENDPOINT.
+            api_version (str, optional): API version. Defaults to API_VERSION.
+            api_key (str, optional): API key, read from AZURE_API_KEY if None. Defaults to None.
+            model (str, optional): Deployment name. Defaults to "gpt-4o".
+            temperature (float, optional): Sampling temperature. Defaults to 0.9.
+            record_path (str, optional): JSONL file every complete response is appended to, for replaying later. Defaults to None.
+        """
+        self.endpoint = endpoint
+        self.api_version = api_version
+        self.api_key = api_key
+        self.model = model
+        self.temperature = temperature
+        self.record_path = record_path
+        self._record_lock = threading.Lock()
+
+    def stream_completion(
+        self, messages, theme=None, num_questions=3, timeout=None, json_mode=False
+    ):
+        start = time.perf_counter()
+        parts = list()
+        usage = None
+        outcome = "error"
+        try:
+            # Shared client, its connections are kept alive between calls
+            stream = self._client().chat.completions.create(
+                model=self.model,
+                messages=messages,
+                temperature=self.temperature,
+                stream=True,
+                **self._request_args(timeout, json_mode),
+            )
+            try:
+                for chunk in stream:
+                    usage = getattr(chunk, "usage", None) or usage
+                    if (
+                        not chunk.choices
+                    ):  # Azure sends content filter results without choices
+                        continue
+                    text = chunk.choices[0].delta.content
+                    if text:
+                        if not parts:
+                            first_token_seconds.observe(
+                                time.perf_counter() - start, mode="stream"
+                            )
+                        parts.append(text)
+                        yield text
+            finally:
+                stream.close()  # Also frees the connection when stopped early
+            outcome = "ok"
+        except GeneratorExit:  # Stopped early by the caller
+            outcome = "cancelled"
+            raise
+        finally:
+            self._observe("stream", start, outcome, messages, "".join(parts), usage)
+        self._record(theme, "".join(parts))
+
+    def completion(
+        self, messages, theme=None, num_questions=3, timeout=None, json_mode=False
+    ):
+        start = time.perf_counter()
+        try:
+            response = self._client().chat.completions.create(
+                model=self.model,
+                messages=messages,
+                temperature=self.temperature,
+                **self._request_args(timeout, json_mode),
+            )
+        except Exception:
+            self._observe("completion", start, "error", messages, "", None)
+            raise
+        text = response.choices[0].message.content or ""
+        # The whole text arrives at once, so the first token comes with the last
+        first_token_seconds.observe(time.perf_counter() - start, mode="completion")
+        self._observe(
+            "completion", start, "ok", messages, text, getattr(response, "usage", None)
+        )
+        self._record(theme, text)
+        return text
+
+    @staticmethod
+    def _observe(mode, start, outcome, messages, text, usage):
+        """Report a finished request to the metrics registry"""
+        request_seconds.observe(time.perf_counter() - start, mode=mode, outcome=outcome)
+        llm_requests.inc(mode=mode, outcome=outcome)
+        llm_bytes.inc(len(text.encode("utf-8")), mode=mode)
+        if outcome == "error":  # Nothing to count, or nothing known about it
+            return
+        if usage is not None:
+            llm_tokens.inc(usage.prompt_tokens, kind="prompt", source="usage")
+            llm_tokens.inc(usage.completion_tokens, kind="completion", source="usage")
+        else:  # About 4 characters per token for English text
+            prompt = sum(len(message["content"]) for message in messages)
+            llm_tokens.inc(prompt // 4, kind="prompt", source="estimate")
+            llm_tokens.inc(len(text) // 4, kind="completion", source="estimate")
+
+    @staticmethod
+    def _request_args(timeout, json_mode):
+        args = dict()
+        # The SDK reads timeout=None as no timeout at all, not as the client default
+        if timeout is not None:
+            args["timeout"] = timeout
+        if json_mode:
+            # JSON schemas need a newer API version, so only valid JSON is enforced
+            # here and the schema is checked while decoding
+            args["response_format"] = {"type": "json_object"}
+        return args
+
+    def _client(self):
+        return get_client(
+            endpoint=self.endpoint, api_version=self.api_version, api_key=self.api_key
+        )
+
+    def _record(self, theme, text):
+        if self.record_path is None:
+            return
+        with self._record_lock:
+            with open(self.record_path, "a", encoding="utf-8") as f:
+                f.write(json.dumps({"theme": theme, "content": text}) + "\n")
+
+
+class Recorded_Backend(Question_Backend):
+    """
+    Replays recorded responses in turn, no network needed
+
+    Responses are replayed as recorded, so json_mode needs recordings made in JSON mode.
+    """
+
+    def __init__(self, completions: list[str], chunk_size: int = 40):
+        """
+        Args:
+            completions (list[str]): Response texts to replay
+            chunk_size (int, optional): Characters per streamed chunk. Defaults to 40.
+        """
+        if not completions:
+            raise ValueError("Need at least one recorded completion")
+        self.completions = list(completions)
+        self.chunk_size = chunk_size
+        self._next = 0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_file(cls, path: str, **kwargs):
+        """Load the responses written by Azure_Backend(record_path=path)"""
+        return cls(load_recordings(path), **kwargs)
+
+    def next_completion(self) -> str:
+        with self._lock:
+            text = self.completions[self._next % len(self.completions)]
+            self._next += 1
+        return text
+
+    def stream_completion(
+        self, messages, theme=None, num_questions=3, timeout=None, json_mode=False
+    ):
+        text = self.next_completion()
+        for i in range(0, len(text), self.chunk_size):
+            yield text[i : i + self.chunk_size]
+
+    def completion(
+        self, messages, theme=None, num_questions=3, timeout=None, json_mode=False
+    ):
+        return self.next_completion()
+
+
+class Pack_Backend(Question_Backend):
+    """Writes random questions of a question pack out as if the LLM had answered"""
+
+    def __init__(self, pack, rng=random, chunk_size: int = 40):
+        """
+        Args:
+            pack (Question_Pack): Pack to take the questions from
+            rng (random.Random, optional): Source of randomness, seed one for repeatable runs. Defaults to random.
+            chunk_size (int, optional): Characters per streamed chunk. Defaults to 40.
+        """
+        self.pack = pack
+        self.rng = rng
+        self.chunk_size = chunk_size
+
+    def stream_completion(
+        self, messages, theme=None, num_questions=3, timeout=None, json_mode=False
+    ):
+        text = self.completion(messages, theme, num_questions, timeout, json_mode)
+        for i in range(0, len(text), self.chunk_size):
+            yield text[i : i + self.chunk_size]
+
+    def completion(
+        self, messages, theme=None, num_questions=3, timeout=None, json_mode=False
+    ):
+        picked = self.pack.sample(theme, num_questions, self.rng)
+        questions = [question for question, _ in picked]
+        oppo_answers = [oppo for _, oppo in picked]
+        if json_mode:
+            return format_json_completion(questions, oppo_answers)
+        return format_completion(questions, oppo_answers)
+
+
+def format_completion(questions: list[dict], oppo_answers: list[list[str]]) -> str:
+    """Write questions in the response format of the prompt, the inverse of parse_questions"""
+    lines = list()
+    for number, (question, oppo_list) in enumerate(zip(questions, oppo_answers), 1):
+        lines.append(f"Question {number}: {question['question']}")
+        names = list(oppo_list)
+        # Opponent answers keep the original case and spaces, fall back to the answers
+        names += question["answer"][len(names) :]
+        for i, name in enumerate(names, 1):
+            if i <= len(question["points"]):
+                lines.append(f"{i}. {name} ({question['points'][i - 1]})")
+            else:
+                lines.append(f"{i}. {name}")
+        lines.append("")
+    return "\n".join(lines)
+
+
+def load_recordings(path: str) -> list[str]:
+    """Read the response texts of a JSONL recording, one {"content": ...} per line"""
+    completions = list()
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                completions.append(json.loads(line)["content"])
+    return completions
+
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def get_backend() -> Question_Backend:
+    """Backend used by Question_Generator, Azure unless set_backend was called"""
+    global _backend
+    with _backend_lock:
+        if _backend is None:
+            _backend = Azure_Backend()
+        return _backend
+
+
+def set_backend(backend: Question_Backend):
+    """Use backend for all question requests from now on"""
+    global _backend
+    with _backend_lock:
+        old, _backend = _backend, backend
+    if old is not None and old is not backend:
+        old.close()
@@ -0,0 +1,420 @@
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+
+DEFAULT_CACHE_PATH = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "question_cache.db"
+)
+# One SQLite file per theme in here, see Sharded_Question_Cache
+DEFAULT_SHARD_DIR = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "question_cache"
+)
+
+
+class Question_Cache:
+    """
+    Persistent SQLite cache of parsed question sets
+
+    Several sets can be stored for each (theme, prompt version) key, get() hands out the
+    least served one so consecutive games rotate through them. A served set is not served
+    again within reuse_delay seconds. Sets expire after ttl seconds or after being served
+    max_uses times. When there are more than max_entries sets, expired ones are evicted
+    first and then the least recently used. Expired sets are kept until stale_ttl,
+    get_stale() serves them when no fresh set can be fetched.
+    """
+
+    def __init__(
+        self,
+        path: str = DEFAULT_CACHE_PATH,
+        ttl: float = 7 * 24 * 3600,
+        max_entries: int = 500,
+        max_uses: int = 3,
+        reuse_delay: float = 600,
+        stale_ttl: float = 30 * 24 * 3600,
+    ):
+        """
+        Args:
+            path (str, optional): SQLite database file. Defaults to question_cache.db next to this file.
+            ttl (float, optional): Seconds until a set expires, None to keep forever. Defaults to 7 days.
+            max_entries (int, optional): Maximum number of stored sets. Defaults to 500.
+            max_uses (int, optional): Times a set is served before it is removed, None for unlimited. Defaults to 3.
+            reuse_delay (float, optional): Seconds before a served set can be served again. Defaults to 600.
+            stale_ttl (float, optional): Seconds until a set is deleted, None to keep forever. Defaults to 30 days.
+        """
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_uses = max_uses
+        self.reuse_delay = reuse_delay
+        self.stale_ttl = stale_ttl
+        self.hits = 0
+        self.misses = 0
+        self.stale_hits = 0
+        self._lock = threading.Lock()
+        # Shared by the game loop and the prefetch thread, access is guarded by _lock
+        self._conn = sqlite3.connect(path, timeout=5, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        with self._conn:
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS question_sets (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    theme TEXT NOT NULL,
+                    prompt_version TEXT NOT NULL,
+                    data TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    last_used REAL NOT NULL,
+                    uses INTEGER NOT NULL DEFAULT 0
+                )
+                """)
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_key ON question_sets "
+                "(theme, prompt_version, uses, last_used)"
+            )
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_last_used ON question_sets (last_used)"
+            )
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_created_at ON question_sets (created_at)"
+            )
+
+    def get(self, theme: str, prompt_version: str):
+        """
+        Serve the least served fresh set of a key
+
+        Returns:
+            The stored value decoded from JSON, or None on a miss
+        """
+        now = time.time()
+        with self._lock, self._conn:
+            self._expire(now)
+            row = self._conn.execute(
+                "SELECT id, data FROM question_sets "
+                "WHERE theme = ? AND prompt_version = ? "
+                "AND (uses = 0 OR last_used <= ?) AND uses < ? AND created_at >= ? "
+                "ORDER BY uses, last_used LIMIT 1",
+                (
+                    theme_key(theme),
+                    prompt_version,
+                    now - self.reuse_delay,
+                    self.max_uses if self.max_uses is not None else 2**62,
+                    now - self.ttl if self.ttl is not None else 0,
+                ),
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+
+            row_id, data = row
+            # Used up sets stay until stale_ttl as a fallback for get_stale()
+            self._conn.execute(
+                "UPDATE question_sets SET uses = uses + 1, last_used = ? WHERE id = ?",
+                (now, row_id),
+            )
+            self.hits += 1
+        return json.loads(data)
+
+    def get_stale(self, theme: str, prompt_version: str):
+        """
+        Serve any stored set, for when no fresh set can be fetched
+
+        Sets of theme are preferred, expired and used up sets are included and the reuse
+        delay is ignored. The least recently served set is returned.
+
+        Returns:
+            The stored value decoded from JSON, or None if nothing is stored
+        """
+        now = time.time()
+        with self._lock, self._conn:
+            self._expire(now)
+            row = self._conn.execute(
+                "SELECT id, data FROM question_sets WHERE prompt_version = ? "
+                "ORDER BY theme = ? DESC, last_used LIMIT 1",
+                (prompt_version, theme_key(theme)),
+            ).fetchone()
+            if row is None:
+                return None
+            row_id, data = row
+            self._conn.execute(
+                "UPDATE question_sets SET last_used = ? WHERE id = ?", (now, row_id)
+            )
+            self.stale_hits += 1
+        return json.loads(data)
+
+    def put(self, theme: str, prompt_version: str, value, uses: int = 0):
+        """
+        Store a set, value must be JSON serializable
+
+        Args:
+            uses (int, optional): Times the set has already been served. Defaults to 0.
+        """
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT INTO question_sets "
+                "(theme, prompt_version, data, created_at, last_used, uses) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (theme_key(theme), prompt_version, json.dumps(value), now, now, uses),
+            )
+            self._evict(now)
+
+    def count(self, theme: str = None, prompt_version: str = None) -> int:
+        """Number of stored sets, optionally only those of one key"""
+        with self._lock:
+            if prompt_version is None:
+                row = self._conn.execute(
+                    "SELECT COUNT(*) FROM question_sets"
+                ).fetchone()
+            else:
+                row = self._conn.execute(
+                    "SELECT COUNT(*) FROM question_sets "
+                    "WHERE theme = ? AND prompt_version = ?",
+                    (theme_key(theme), prompt_version),
+                ).fetchone()
+        return row[0]
+
+    def iter_sets(self, prompt_version: str = None):
+        """
+        Yield every stored set without counting it as served
+
+        Yields:
+            tuple[str, str, object]: (theme key, prompt version, decoded value)
+        """
+        with self._lock:
+            if prompt_version is None:
+                rows = self._conn.execute(
+                    "SELECT theme, prompt_version, data FROM question_sets ORDER BY id"
+                ).fetchall()
+            else:
+                rows = self._conn.execute(
+                    "SELECT theme, prompt_version, data FROM question_sets "
+                    "WHERE prompt_version = ? ORDER BY id",
+                    (prompt_version,),
+                ).fetchall()
+        for theme, version, data in rows:
+            yield (theme, version, json.loads(data))
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "stale_hits": self.stale_hits,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+            "entries": self.count(),
+        }
+
+    def clear(self):
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM question_sets")
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def _expire(self, now):
+        """Delete sets older than stale_ttl, caller must hold the lock"""
+        if self.stale_ttl is not None:
+            self._conn.execute(
+                "DELETE FROM question_sets WHERE created_at < ?",
+                (now - self.stale_ttl,),
+            )
+
+    def _evict(self, now):
+        """Delete sets above max_entries, caller must hold the lock"""
+        if self.max_entries is None:
+            return
+        (total,) = self._conn.execute("SELECT COUNT(*) FROM question_sets").fetchone()
+        if total > self.max_entries:
+            # Used up or expired sets are only a fallback, fresh ones go last
+            self._conn.execute(
+                "DELETE FROM question_sets WHERE id IN ("
+                "SELECT id FROM question_sets "
+                "ORDER BY (uses >= ? OR created_at < ?) DESC, last_used LIMIT ?)",
+                (
+                    self.max_uses if self.max_uses is not None else 2**62,
+                    now - self.ttl if self.ttl is not None else 0,
+                    total - self.max_entries,
+                ),
+            )
+
+
+class Sharded_Question_Cache:
+    """
+    Question cache with one SQLite file per theme, same interface as Question_Cache
+
+    Warming up or filling one theme only touches its own file and lock, so it never
+    holds up the game reading another theme. Shards are opened on first use, and limits
+    such as max_entries apply to each shard.
+    """
+
+    def __init__(self, directory: str = DEFAULT_SHARD_DIR, **cache_args):
+        """
+        Args:
+            directory (str, optional): Folder of the shard files, created if missing. Defaults to question_cache/ next to this file.
+            **cache_args: Passed on to the Question_Cache of each shard
+        """
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.cache_args = cache_args
+        self._lock = threading.Lock()
+        self._shards = dict()  # shard file name -> Question_Cache
+
+    def shard(self, theme: str) -> Question_Cache:
+        """The cache of theme, opened on first use"""
+        return self._open(shard_name(theme))
+
+    def get(self, theme: str, prompt_version: str):
+        return self.shard(theme).get(theme, prompt_version)
+
+    def get_stale(self, theme: str, prompt_version: str):
+        """Serve any stored set of theme, or of another theme if it has none"""
+        own = self.shard(theme)
+        value = own.get_stale(theme, prompt_version)
+        if value is not None:
+            return value
+        for cache in self._all():
+            if cache is not own:
+                value = cache.get_stale(theme, prompt_version)
+                if value is not None:
+                    return value
+        return None
+
+    def put(self, theme: str, prompt_version: str, value, uses: int = 0):
+        self.shard(theme).put(theme, prompt_version, value, uses)
+
+    def import_cache(self, path: str) -> int:
+        """
+        Copy the sets of a single-file Question_Cache into the shards, ages and uses kept
+
+        Returns:
+            int: Number of sets copied
+        """
+        old = sqlite3.connect(path)
+        try:
+            rows = old.execute(
+                "SELECT theme, prompt_version, data, created_at, last_used, uses "
+                "FROM question_sets ORDER BY id"
+            ).fetchall()
+            # Fold the write-ahead log into the file so it can be moved on its own
+            old.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        finally:
+            old.close()
+        shards = dict()
+        for row in rows:
+            shards.setdefault(row[0], list()).append(row)
+        now = time.time()
+        for key, key_rows in shards.items():
+            cache = self.shard(key)
+            with cache._lock, cache._conn:
+                cache._conn.executemany(
+                    "INSERT INTO question_sets "
+                    "(theme, prompt_version, data, created_at, last_used, uses) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    key_rows,
+                )
+                cache._evict(now)
+        return len(rows)
+
+    def count(self, theme: str = None, prompt_version: str = None) -> int:
+        if prompt_version is not None:
+            return self.shard(theme).count(theme, prompt_version)
+        return sum(cache.count() for cache in self._all())
+
+    def iter_sets(self, prompt_version: str = None):
+        for cache in self._all():
+            yield from cache.iter_sets(prompt_version)
+
+    def stats(self) -> dict:
+        caches = self._all()
+        hits = sum(cache.hits for cache in caches)
+        misses = sum(cache.misses for cache in caches)
+        return {
+            "hits": hits,
+            "misses": misses,
+            "stale_hits": sum(cache.stale_hits for cache in caches),
+            "hit_ratio": hits / (hits + misses) if hits + misses else 0.0,
+            "entries": sum(cache.count() for cache in caches),
+            "shards": len(caches),
+        }
+
+    def clear(self):
+        for cache in self._all():
+            cache.clear()
+
+    def close(self):
+        with self._lock:
+            shards, self._shards = self._shards, dict()
+        for cache in shards.values():
+            cache.close()
+
+    def _open(self, name):
+        with self._lock:
+            cache = self._shards.get(name)
+            if cache is None:
+                cache = Question_Cache(
+                    os.path.join(self.directory, name), **self.cache_args
+                )
+                self._shards[name] = cache
+            return cache
+
+    def _all(self) -> list[Question_Cache]:
+        """Every shard on disk, opened if needed"""
+        names = [name for name in os.listdir(self.directory) if name.endswith(".db")]
+        return [self._open(name) for name in sorted(names)]
+
+
+def theme_key(theme: str) -> str:
+    """Normalize a theme so that "Science" and " science" share the same sets"""
+    return "" if theme is None else theme.strip().lower()
+
+
+def shard_name(theme: str) -> str:
+    """File name of the shard of theme, readable and without collisions"""
+    key = theme_key(theme)
+    slug = re.sub(r"[^a-z0-9]+", "_", key).strip("_")[:40] or "default"
+    digest = hashlib.blake2b(key.encode("utf-8"), digest_size=4).hexdigest()
+    return f"{slug}-{digest}.db"
+
+
+def open_cache(path: str):
+    """A Sharded_Question_Cache for a folder, a Question_Cache for a single file"""
+    if os.path.isdir(path):
+        return Sharded_Question_Cache(path)
+    return Question_Cache(path)
+
+
+_default_cache = None
+_default_cache_lock = threading.Lock()
+
+
+def get_default_cache() -> Sharded_Question_Cache:
+    """Return the process-wide cache, created on first use"""
+    global _default_cache
+    with _default_cache_lock:
+        if _default_cache is None:
+            _default_cache = Sharded_Question_Cache()
+            # Sets of the single-file cache used before the shards are moved over once
+            if os.path.exists(DEFAULT_CACHE_PATH):
+                _default_cache.import_cache(DEFAULT_CACHE_PATH)
+                # Left-over -wal/-shm files go with it, or SQLite would pair them with a new file
+                for suffix in ("", "-wal", "-shm"):
+                    if os.path.exists(DEFAULT_CACHE_PATH + suffix):
+                        os.replace(
+                            DEFAULT_CACHE_PATH + suffix,
+                            DEFAULT_CACHE_PATH + ".migrated" + suffix,
+                        )
+        return _default_cache
+
+
+def set_default_cache(cache: Question_Cache):
+    """Use cache as the process-wide cache from now on, the old one is closed"""
+    global _default_cache
+    with _default_cache_lock:
+        old, _default_cache = _default_cache, cache
+    if old is not None and old is not cache:
+        old.close()
@@ -0,0 +1,232 @@
+import hashlib
+import re
+import struct
+import threading
+from array import array
+from bisect import bisect_left
+from functools import lru_cache
+
+from question_cache import get_default_cache
+
+WORD = re.compile(r"[a-z0-9]+")
+# Words every question has, they say nothing about what is asked
+STOPWORDS = frozenset("""
+    a an the and or of to in on at for from by with about into is are be do does
+    that this these those what which who you youre your people person
+    someone something things thing name might would could most popular common
+    """.split())
+
+
+def normalize_question(text: str) -> str:
+    """Lowercase words without punctuation, equal for questions that only differ in case or symbols"""
+    return " ".join(WORD.findall(text.casefold().replace("'", "")))
+
+
+def question_tokens(text: str) -> frozenset:
+    """Content words of a question, plural s removed"""
+    words = set(WORD.findall(text.casefold().replace("'", ""))) - STOPWORDS
+    return frozenset(
+        word[:-1] if len(word) > 3 and word[-1] == "s" and word[-2] != "s" else word
+        for word in words
+    )
+
+
+@lru_cache(maxsize=1 << 16)
+def _token_hashes(token: str, num_perm: int) -> tuple:
+    """num_perm independent 32-bit hashes of a token, the same words come up all the time"""
+    data = token.encode("utf-8")
+    # A digest holds 16 hashes at most, salted digests give the rest
+    digest = b"".join(
+        hashlib.blake2b(data, salt=bytes([i])).digest()
+        for i in range((num_perm + 15) // 16)
+    )
+    return struct.unpack_from(f"<{num_perm}I", digest)
+
+
+class Question_Index:
+    """
+    Index of the questions seen so far, to spot repeats of old questions
+
+    Exact repeats are found by a hash of the normalized text. Rewordings are found with
+    MinHash signatures of the content words and locality-sensitive hashing: the
+    signature is cut into bands, and questions sharing a band are compared.
+
+    Band keys are kept in sorted arrays of (band hash << 32 | question id), so a few
+    hundred thousand questions take tens of MB instead of a dict entry per band.
+    """
+
+    def __init__(
+        self,
+        threshold: float = 0.6,
+        num_perm: int = 30,
+        bands: int = 10,
+        merge_every: int = 4096,
+    ):
+        """
+        Args:
+            threshold (float, optional): Estimated Jaccard similarity of the content words from which two questions are duplicates. Defaults to 0.6.
+            num_perm (int, optional): MinHash signature length. Defaults to 30.
+            bands (int, optional): LSH bands, must divide num_perm. More bands find more candidates. Defaults to 10.
+            merge_every (int, optional): Least number of questions whose band keys are collected before they are merged into the sorted arrays, a quarter of the index once it is larger. Defaults to 4096.
+        """
+        if num_perm % bands:
+            raise ValueError("bands must divide num_perm")
+        self.threshold = threshold
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.merge_every = merge_every
+        self.lookups = 0
+        self.exact_hits = 0  # Lookups that matched a normalized hash
+        self.near_hits = 0  # Lookups that matched by MinHash
+        self._exact = (
+            set()
+        )  # Hashes of the normalized questions, only kept in memory so hash() will do
+        self._signatures = array("I")  # num_perm values per question id
+        self._sorted = [array("Q") for _ in range(bands)]
+        self._pending = [dict() for _ in range(bands)]  # band hash -> list of ids
+        self._num_pending = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._signatures) // self.num_perm
+
+    def contains(self, text: str) -> bool:
+        """Whether text is a repeat of a question in the index"""
+        fingerprint = self._fingerprint(text)
+        with self._lock:
+            return self._find(*fingerprint)
+
+    def add(self, text: str) -> bool:
+        """
+        Add text unless it is a repeat
+
+        Returns:
+            bool: True if it was new and added
+        """
+        fingerprint = self._fingerprint(text)
+        with self._lock:
+            if self._find(*fingerprint):
+                return False
+            self._insert(*fingerprint)
+            return True
+
+    def add_all(self, texts) -> int:
+        """Add every text, repeats included, returns the number added"""
+        count = 0
+        for text in texts:
+            fingerprint = self._fingerprint(text)
+            with self._lock:
+                self._insert(*fingerprint)
+            count += 1
+        return count
+
+    def add_cache(self, cache, prompt_version: str = None) -> int:
+        """Add the questions of every set in a question cache"""
+        return self.add_all(
+            question["question"]
+            for _, _, value in cache.iter_sets(prompt_version)
+            for question in value[0]
+        )
+
+    def add_pack(self, pack) -> int:
+        """Add the questions of a question pack"""
+        return self.add_all(pack.question(i)[0]["question"] for i in range(len(pack)))
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "questions": len(self),
+                "lookups": self.lookups,
+                "exact_hits": self.exact_hits,
+                "near_hits": self.near_hits,
+            }
+
+    def _fingerprint(self, text):
+        """(normalized hash, MinHash signature, band keys), computed outside the lock"""
+        exact = hash(normalize_question(text))
+        tokens = question_tokens(text)
+        if not tokens:  # Nothing but stopwords, only exact repeats are found
+            return (exact, None, None)
+        rows = [_token_hashes(token, self.num_perm) for token in tokens]
+        signature = rows[0] if len(rows) == 1 else tuple(map(min, *rows))
+        step = self.rows
+        band_keys = [
+            hash(signature[start : start + step]) & 0xFFFFFFFF
+            for start in range(0, self.num_perm, step)
+        ]
+        return (exact, signature, band_keys)
+
+    def _find(self, exact, signature, band_keys):
+        """Caller must hold the lock"""
+        self.lookups += 1
+        if exact in self._exact:
+            self.exact_hits += 1
+            return True
+        if signature is None:
+            return False
+
+        checked = set()
+        for band, key in enumerate(band_keys):
+            candidates = list(self._pending[band].get(key, ()))
+            keys = self._sorted[band]
+            i = bisect_left(keys, key << 32)
+            while i < len(keys) and keys[i] >> 32 == key:
+                candidates.append(keys[i] & 0xFFFFFFFF)
+                i += 1
+            for question_id in candidates:
+                if question_id in checked:
+                    continue
+                checked.add(question_id)
+                start = question_id * self.num_perm
+                other = self._signatures[start : start + self.num_perm]
+                same = sum(a == b for a, b in zip(signature, other))
+                if same >= self.threshold * self.num_perm:
+                    self.near_hits += 1
+                    return True
+        return False
+
+    def _insert(self, exact, signature, band_keys):
+        """Caller must hold the lock"""
+        question_id = len(self)
+        self._exact.add(exact)
+        if signature is None:
+            self._signatures.extend([0] * self.num_perm)
+            return
+        self._signatures.extend(signature)
+        for band, key in enumerate(band_keys):
+            self._pending[band].setdefault(key, list()).append(question_id)
+        self._num_pending += 1
+        # Merging rewrites the arrays, so merge less often as they grow
+        if self._num_pending >= max(self.merge_every, question_id // 4):
+            self._merge()
+
+    def _merge(self):
+        """Move the pending band keys into the sorted arrays, caller must hold the lock"""
+        for band in range(self.bands):
+            new_keys = [
+                key << 32 | question_id
+                for key, ids in self._pending[band].items()
+                for question_id in ids
+            ]
+            new_keys.sort()
+            # Two sorted runs, timsort merges them in one pass
+            self._sorted[band] = array(
+                "Q", sorted(self._sorted[band] + array("Q", new_keys))
+            )
+            self._pending[band] = dict()
+        self._num_pending = 0
+
+
+_default_index = None
+_default_index_lock = threading.Lock()
+
+
+def get_default_index() -> Question_Index:
+    """Return the process-wide index, built from the question cache on first use"""
+    global _default_index
+    with _default_index_lock:
+        if _default_index is None:
+            _default_index = Question_Index()
+            _default_index.add_cache(get_default_cache())
+        return _default_index
@@ -0,0 +1,600 @@
+import json
+import time
+
+from circuit_breaker import CLOSED, Circuit_Breaker, Circuit_Open
+from hedged_fetch import Deadline_Exceeded, Hedged_Fetcher
+from metrics import registry
+from question_backend import get_backend
+from question_cache import get_default_cache
+from question_dedup import get_default_index
+from question_json import (
+    QUESTION_SET_SCHEMA,
+    Question_Json_Parser,
+    parse_json_questions,
+)
+from question_parser import Question_Parser, parse_questions
+from question_prefetch import is_valid_question_set
+from rate_limit import is_rate_limited
+
+QUESTIONS_PER_GAME = 3
+FETCH_DEADLINE = (
+    20  # Seconds a game start waits for the LLM before falling back to the cache
+)
+
+
+fetch_seconds = registry.histogram(
+    "question_fetch_seconds", "Seconds get_questions took, by where the set came from"
+)
+first_question_seconds = registry.histogram(
+    "question_time_to_first_question_seconds",
+    "Seconds until stream_questions yielded its first question",
+)
+cache_lookups = registry.counter(
+    "question_cache_lookups_total", "Fresh set lookups in the question cache"
+)
+registry.gauge(
+    "question_cache_hit_ratio",
+    "Share of cache lookups that found a fresh set",
+    func=lambda: cache_lookups.value(result="hit")
+    / max(cache_lookups.value(result="hit") + cache_lookups.value(result="miss"), 1),
+)
+parsed_responses = registry.counter(
+    "question_responses_parsed_total", "LLM responses parsed into questions"
+)
+parse_failures = registry.counter(
+    "question_parse_failures_total",
+    "Parsed responses with fewer complete questions than asked for",
+)
+registry.gauge(
+    "question_parse_failure_ratio",
+    "Share of parsed responses with questions missing",
+    func=lambda: sum(value for _, _, value in parse_failures.samples())
+    / max(sum(value for _, _, value in parsed_responses.samples()), 1),
+)
+
+
+def record_parse(asked: int, parsed: int, json_mode: bool):
+    """Count a parsed response, a failure if questions are missing"""
+    mode = "json" if json_mode else "text"
+    parsed_responses.inc(mode=mode)
+    if parsed < asked:
+        parse_failures.inc(mode=mode)
+
+
+class Question_Generator:
+    PROMPT_VERSION = "1"  # Change whenever the prompt changes, cached sets of older prompts are not used
+    json_mode = False  # Ask for JSON matching QUESTION_SET_SCHEMA instead of free text
+    dedup = True  # Replace questions that repeat ones in the question cache
+
+    @staticmethod
+    def get_questions(
+        theme: str = None, use_cache: bool = True
+    ) -> tuple[list[dict], list[list[str]]]:
+        """
+        Generate questions and answers based on a specified theme
+
+        Args:
+            theme (str, optional): Theme for the questions. Defaults to None.
+            use_cache (bool, optional): Serve and store sets in the question cache. Defaults to True.
+
+        Returns tuple of two elements:
+
+            list[dict]: A list of 3 question dictionaries, each containing:
+                - question (str): The question
+                - answer (list[str]): List of the 6 answers in lowercase
+                - points (list[int]): Corresponding points for each answer
+
+            list[list[str]]: 3 lists of strings, they are the list of guesses used by the AI opponent
+        """
+        start = time.perf_counter()
+        cache = get_default_cache() if use_cache else None
+        if cache is not None:
+            cached = cache.get(theme, Question_Generator.PROMPT_VERSION)
+            cache_lookups.inc(result="miss" if cached is None else "hit")
+            if cached is not None:
+                fetch_seconds.observe(time.perf_counter() - start, source="cache")
+                return (cached[0], cached[1])
+
+        if not backend_breaker.allow():  # Backend is down, do not wait for it
+            stale = Question_Generator.serve_stale(theme, cache)
+            if stale is None:
+                raise Circuit_Open("Question backend is down and nothing is cached")
+            fetch_seconds.observe(time.perf_counter() - start, source="stale")
+            return stale
+        try:
+            # A second request is sent if the first one is slower than usual
+            ret, ret2 = hedged_fetcher.fetch(theme)
+        except Exception as e:
+            record_backend_failure(e)
+            stale = Question_Generator.serve_stale(theme, cache)
+            if stale is None:
+                raise
+            fetch_seconds.observe(time.perf_counter() - start, source="stale")
+            return stale
+        backend_breaker.record_success()
+        backend_breaker.record_fallback(False)
+
+        if Question_Generator.dedup:
+            ret, ret2 = Question_Generator.replace_duplicates(theme, ret, ret2)
+        if cache is not None:
+            # This set is played right away, so it counts as served once
+            cache.put(theme, Question_Generator.PROMPT_VERSION, [ret, ret2], uses=1)
+        fetch_seconds.observe(time.perf_counter() - start, source="llm")
+        return (ret, ret2)
+
+    @staticmethod
+    def request_questions(
+        theme: str = None, cancel_event=None, deadline: float = FETCH_DEADLINE
+    ) -> tuple[list[dict], list[list[str]]]:
+        """
+        Send a single request without the cache, stops early once cancel_event is set
+
+        deadline also bounds the request itself, so a loser of hedged_fetcher that stalls
+        before its first chunk still frees its worker.
+        """
+        ret = list()
+        ret2 = list()
+        # Only the request that wins is checked for duplicates, by get_questions
+        for question, oppo_list in Question_Generator.stream_questions(
+            theme,
+            use_cache=False,
+            cancel_event=cancel_event,
+            deadline=deadline,
+            dedup=False,
+            breaker=False,
+            hedge=False,
+        ):
+            ret.append(question)
+            ret2.append(oppo_list)
+        return (ret, ret2)
+
+    @staticmethod
+    def request_stream(
+        messages: list[dict],
+        theme: str,
+        json_mode: bool,
+        timeout: float,
+        cancel_event=None,
+    ):
+        """Stream the text of a single response, stops early once cancel_event is set"""
+        stream = get_backend().stream_completion(
+            messages,
+            theme=theme,
+            num_questions=QUESTIONS_PER_GAME,
+            timeout=timeout,
+            json_mode=json_mode,
+        )
+        try:
+            for text in stream:
+                if cancel_event is not None and cancel_event.is_set():
+                    return
+                yield text
+        finally:
+            stream.close()  # Also frees the connection when stopped early
+
+    @staticmethod
+    def stream_questions(
+        theme: str = None,
+        use_cache: bool = True,
+        cancel_event=None,
+        deadline: float = FETCH_DEADLINE,
+        dedup: bool = None,
+        breaker: bool = True,
+        hedge: bool = True,
+    ):
+        """
+        Same as get_questions, but the response is streamed and parsed as it arrives
+
+        Args:
+            cancel_event (threading.Event, optional): Stop streaming once it is set. Defaults to None.
+            deadline (float, optional): Seconds until the stream is given up, None for no limit. Defaults to FETCH_DEADLINE.
+            dedup (bool, optional): Hold back repeated questions and request replacements at the end, None to follow Question_Generator.dedup. Defaults to None.
+            breaker (bool, optional): Go through backend_breaker, off for the requests of get_questions which already does. Defaults to True.
+            hedge (bool, optional): Send a second request through hedged_streamer if the first chunk is slower than usual, off for the requests of hedged_fetcher. Defaults to True.
+
+        Yields:
+            tuple[dict, list[str]]: (question, opponent answers) as soon as each question is complete
+        """
+        start = time.perf_counter()
+        cache = get_default_cache() if use_cache else None
+        if cache is not None:
+            cached = cache.get(theme, Question_Generator.PROMPT_VERSION)
+            cache_lookups.inc(result="miss" if cached is None else "hit")
+            if cached is not None:
+                first_question_seconds.observe(
+                    time.perf_counter() - start, source="cache"
+                )
+                yield from zip(cached[0], cached[1])
+                return
+        if breaker and not backend_breaker.allow():
+            stale = Question_Generator.serve_stale(theme, cache)
+            if stale is None:
+                raise Circuit_Open("Question backend is down and nothing is cached")
+            first_question_seconds.observe(time.perf_counter() - start, source="stale")
+            yield from zip(*stale)
+            return
+
+        json_mode = Question_Generator.json_mode
+        parser = Question_Json_Parser() if json_mode else Question_Parser()
+        if dedup is None:
+            dedup = Question_Generator.dedup
+        index = get_default_index() if dedup else None
+        duplicates = list()  # Held back, only used if no replacement arrives
+        produced = 0  # Complete questions parsed, repeats included
+        ret = list()
+        ret2 = list()
+        try:
+            request = (
+                Question_Generator.build_messages(theme, json_mode=json_mode),
+                theme,
+                json_mode,
+                deadline,
+            )
+            if hedge:
+                stream = hedged_streamer.stream(
+                    *request, deadline=FETCH_DEADLINE if deadline is None else deadline
+                )
+            else:
+                stream = Question_Generator.request_stream(*request)
+            try:
+                for text in stream:
+                    if cancel_event is not None and cancel_event.is_set():
+                        return
+                    if deadline is not None and time.perf_counter() - start > deadline:
+                        raise Deadline_Exceeded(
+                            f"No complete response within {deadline}s"
+                        )
+                    for question, oppo_list in parser.feed(text):
+                        produced += 1
+                        if index is not None and not index.add(question["question"]):
+                            duplicates.append((question, oppo_list))
+                            continue
+                        if not ret:
+                            first_question_seconds.observe(
+                                time.perf_counter() - start, source="llm"
+                            )
+                        ret.append(question)
+                        ret2.append(oppo_list)
+                        yield (question, oppo_list)
+            finally:
+                stream.close()  # Also stops the requests when stopped early
+        except Exception as e:
+            if breaker:
+                record_backend_failure(e)
+            # Nothing was handed out yet, so a stale set can still be used instead
+            if cache is None or ret:
+                raise
+            stale = Question_Generator.serve_stale(theme, cache)
+            if stale is None:
+                raise
+            first_question_seconds.observe(time.perf_counter() - start, source="stale")
+            yield from zip(*stale)
+            return
+        if breaker:
+            backend_breaker.record_success()
+            backend_breaker.record_fallback(False)
+
+        parsed = list()
+        closed = parser.close()
+        record_parse(QUESTIONS_PER_GAME, produced + len(closed), json_mode)
+        for question, oppo_list in closed:
+            if index is not None and not index.add(question["question"]):
+                duplicates.append((question, oppo_list))
+            else:
+                parsed.append((question, oppo_list))
+        if duplicates:
+            parsed += Question_Generator.request_replacements(
+                theme,
+                len(duplicates),
+                [question["question"] for question in ret + [q for q, _ in duplicates]],
+            )
+            # A repeat is still better than a game with a question missing
+            missing = QUESTIONS_PER_GAME - len(ret) - len(parsed)
+            parsed += duplicates[: max(missing, 0)]
+        for question, oppo_list in parsed:
+            ret.append(question)
+            ret2.append(oppo_list)
+            yield (question, oppo_list)
+
+        if cache is not None and is_valid_question_set((ret, ret2)):
+            cache.put(theme, Question_Generator.PROMPT_VERSION, [ret, ret2], uses=1)
+
+    @staticmethod
+    def get_question_batch(
+        theme: str = None,
+        num_games: int = 5,
+        breaker: bool = True,
+        deadline: float = FETCH_DEADLINE,
+    ) -> list[tuple[list[dict], list[list[str]]]]:
+        """
+        Generate the questions of several games in a single request
+
+        Args:
+            theme (str, optional): Theme for the questions. Defaults to None.
+            num_games (int, optional): Number of games, 3 questions each. Defaults to 5.
+            breaker (bool, optional): Go through backend_breaker, off for bulk jobs that handle failures themselves. Defaults to True.
+            deadline (float, optional): Seconds until the request is given up, None for no limit. Defaults to FETCH_DEADLINE.
+
+        Returns:
+            list[tuple[list[dict], list[list[str]]]]: One (questions, oppo_answers) tuple per complete game,
+            can be fewer than num_games if the response was cut short or had repeated questions
+        """
+        num_questions = QUESTIONS_PER_GAME * num_games
+        json_mode = Question_Generator.json_mode
+        if breaker and not backend_breaker.allow():
+            raise Circuit_Open("Question backend is down")
+        try:
+            text = get_backend().completion(
+                Question_Generator.build_messages(theme, num_questions, json_mode),
+                theme=theme,
+                num_questions=num_questions,
+                timeout=deadline,
+                json_mode=json_mode,
+            )
+        except Exception as e:
+            if breaker:
+                record_backend_failure(e)
+            raise
+        if breaker:
+            backend_breaker.record_success()
+        if json_mode:
+            questions, oppo_answers = parse_json_questions(text)
+        else:
+            questions, oppo_answers = parse_questions(text)
+        record_parse(num_questions, len(questions), json_mode)
+        if Question_Generator.dedup:
+            # No replacements here, the caller asks for another batch if it is short
+            index = get_default_index()
+            new = [index.add(question["question"]) for question in questions]
+            questions = [q for q, keep in zip(questions, new) if keep]
+            oppo_answers = [oppo for oppo, keep in zip(oppo_answers, new) if keep]
+
+        ret = list()
+        for i in range(0, len(questions), QUESTIONS_PER_GAME):
+            question_set = (
+                questions[i : i + QUESTIONS_PER_GAME],
+                oppo_answers[i : i + QUESTIONS_PER_GAME],
+            )
+            if is_valid_question_set(question_set):
+                ret.append(question_set)
+        return ret[:num_games]
+
+    @staticmethod
+    def get_question_sets(
+        theme: str = None, num_games: int = 5
+    ) -> list[tuple[list[dict], list[list[str]]]]:
+        """
+        Serve up to num_games sets from the cache shard of theme, the rest generated in one batch
+
+        If the batch fails and nothing was cached, a single set is fetched with get_questions
+        instead, which is hedged and falls back to a stale set.
+
+        Returns:
+            list[tuple[list[dict], list[list[str]]]]: Same as get_question_batch
+        """
+        cache = get_default_cache()
+        ret = list()
+        while len(ret) < num_games:
+            cached = cache.get(theme, Question_Generator.PROMPT_VERSION)
+            if cached is None:
+                break
+            ret.append((cached[0], cached[1]))
+        if len(ret) < num_games:
+            try:
+                ret += Question_Generator.get_question_batch(
+                    theme, num_games - len(ret)
+                )
+            except Exception:
+                if not ret:  # Cached sets are still worth playing if the batch fails
+                    ret.append(Question_Generator.get_questions(theme))
+        return ret
+
+    @staticmethod
+    def replace_duplicates(
+        theme: str, questions: list[dict], oppo_answers: list[list[str]]
+    ) -> tuple[list[dict], list[list[str]]]:
+        """
+        Swap questions already in the dedup index for newly requested ones
+
+        Only the repeated questions are requested again. New questions are added to the
+        index. A repeat is kept if no replacement arrives.
+        """
+        index = get_default_index()
+        repeated = [
+            i
+            for i, question in enumerate(questions)
+            if not index.add(question["question"])
+        ]
+        if not repeated:
+            return (questions, oppo_answers)
+
+        replacements = Question_Generator.request_replacements(
+            theme, len(repeated), [question["question"] for question in questions]
+        )
+        questions = list(questions)
+        oppo_answers = list(oppo_answers)
+        for i, (question, oppo_list) in zip(repeated, replacements):
+            questions[i] = question
+            oppo_answers[i] = oppo_list
+        return (questions, oppo_answers)
+
+    @staticmethod
+    def request_replacements(
+        theme: str, count: int, avoid: list[str]
+    ) -> list[tuple[dict, list[str]]]:
+        """
+        Request count questions that are not in the dedup index
+
+        Args:
+            avoid (list[str]): Questions the prompt asks not to repeat
+
+        Returns:
+            list[tuple[dict, list[str]]]: Up to count new (question, opponent answers), fewer if the request failed
+        """
+        json_mode = Question_Generator.json_mode
+        if not backend_breaker.allow():
+            return list()
+        try:
+            text = get_backend().completion(
+                Question_Generator.build_messages(theme, count, json_mode, avoid),
+                theme=theme,
+                num_questions=count,
+                timeout=FETCH_DEADLINE,
+                json_mode=json_mode,
+            )
+        except Exception as e:
+            record_backend_failure(e)
+            return list()
+        backend_breaker.record_success()
+        questions, oppo_answers = (
+            parse_json_questions(text) if json_mode else parse_questions(text)
+        )
+        record_parse(count, len(questions), json_mode)
+
+        index = get_default_index()
+        ret = list()
+        for question, oppo_list in zip(questions, oppo_answers):
+            if len(ret) < count and index.add(question["question"]):
+                ret.append((question, oppo_list))
+        return ret
+
+    @staticmethod
+    def serve_stale(theme: str, cache) -> tuple[list[dict], list[list[str]]]:
+        """
+        A stale cached set for when no new set can be fetched, counted as a fallback
+
+        Returns:
+            tuple[list[dict], list[list[str]]] or None: None if there is no cache or nothing in it
+        """
+        stale = None
+        if cache is not None:
+            stale = cache.get_stale(theme, Question_Generator.PROMPT_VERSION)
+        backend_breaker.record_fallback(stale is not None)
+        return None if stale is None else (stale[0], stale[1])
+
+    @staticmethod
+    def fill_cache(theme: str = None, num_games: int = 5) -> int:
+        """Generate a batch of games and store them in the question cache, returns the number stored"""
+        cache = get_default_cache()
+        # Nobody waits for these sets, so the response may take as long as it needs
+        question_sets = Question_Generator.get_question_batch(
+            theme, num_games, deadline=FETCH_DEADLINE * num_games
+        )
+        for questions, oppo_answers in question_sets:
+            cache.put(
+                theme, Question_Generator.PROMPT_VERSION, [questions, oppo_answers]
+            )
+        return len(question_sets)
+
+    @staticmethod
+    def build_messages(
+        theme: str = None,
+        num_questions: int = 3,
+        json_mode: bool = False,
+        avoid: list[str] = None,
+    ) -> list[dict]:
+        """Build the chat messages asking for num_questions questions, none of them in avoid"""
+        theme_prompt = ""
+        if theme != None:
+            theme_prompt = "related to the theme " + theme
+        avoid_prompt = ""
+        if avoid:
+            avoid_prompt = " Do not ask any of these questions: " + "; ".join(avoid)
+
+        if json_mode:
+            return [
+                {"role": "system", "content": "You are a helpful assistant."},
+                {
+                    "role": "user",
+                    "content": (
+                        f"Create {num_questions} questions for playing the 'Guess Their Answer' game "
+                        + theme_prompt
+                        + ". "
+                        "Reply with JSON only, matching this JSON schema: "
+                        + json.dumps(QUESTION_SET_SCHEMA)
+                        + ". Each question has 6 answers, the most popular ones, "
+                        "and 4 extra_answers that are less popular. "
+                        "Restrict your question to at most 60 characters long. "
+                        "Restrict each answer to at most 2 words. "
+                        "In the answers, do not include any numbers or symbols. "
+                        "Assign a total of 100 points to the 6 answers." + avoid_prompt
+                    ),
+                },
+            ]
+        markers = ",".join(f"'Question {i}: '" for i in range(1, num_questions + 1))
+
+        return [
+            {"role": "system", "content": "You are a helpful assistant."},
+            {
+                "role": "user",
+                "content": (
+                    f"Create {num_questions} questions for playing the 'Guess Their Answer' game "
+                    + theme_prompt
+                    + ","
+                    "each question has 10 answers with the first 6 answers being the most popular ones. "
+                    "Restrict your question to at most 60 characters long. "
+                    "Restrict each answer to at most 2 words"
+                    "Do not use any text formatting in your response, "
+                    "In the answers, do not include any numbers or symbols. "
+                    "Use " + markers + " to indicate each question, "
+                    "then use a numbered list for the answers"
+                    "Assign a total of 100 points to the first 6 answers, put them in a bracket after each answer, "
+                    "do not include anything else in the brackets" + avoid_prompt
+                ),
+            },
+        ]
+
+
+def record_backend_failure(error: Exception):
+    """
+    Count a failed request against backend_breaker, unless it was a 429
+
+    A 429 means the backend is up but busy, slowing down is up to the caller. Counting
+    them would open the breaker under a rate limited bulk job and stop it altogether.
+    """
+    if not is_rate_limited(error) and not is_rate_limited(error.__cause__):
+        backend_breaker.record_failure()
+
+
+def probe_backend():
+    """Ask for a single question, raises if the backend is still down"""
+    json_mode = Question_Generator.json_mode
+    try:
+        text = get_backend().completion(
+            Question_Generator.build_messages(None, 1, json_mode),
+            num_questions=1,
+            timeout=FETCH_DEADLINE,
+            json_mode=json_mode,
+        )
+    except Exception as e:
+        if is_rate_limited(e):  # Busy but up
+            return
+        raise
+    questions, _ = parse_json_questions(text) if json_mode else parse_questions(text)
+    if not questions:
+        raise ValueError("No question in the probe response")
+
+
+# Opened by failures of any request, get_questions then serves stale sets at once
+backend_breaker = Circuit_Breaker(probe=probe_backend)
+registry.gauge(
+    "question_backend_breaker_open",
+    "1 while the circuit breaker of the question backend is open",
+    func=lambda: backend_breaker.state != CLOSED,
+)
+registry.gauge(
+    "question_backend_fallback_ratio",
+    "Share of set requests served from stale cached sets",
+    func=lambda: backend_breaker.stats()["fallback_rate"],
+)
+
+# Process-wide, so the observed latencies carry over between games
+hedged_fetcher = Hedged_Fetcher(
+    Question_Generator.request_questions,
+    validate=is_valid_question_set,
+    deadline=FETCH_DEADLINE,
+)
+# Hedges streamed sets on their first chunk, so the latencies are times to first chunk
+hedged_streamer = Hedged_Fetcher(
+    Question_Generator.request_stream, deadline=FETCH_DEADLINE
+)
@@ -0,0 +1,225 @@
+import json
+import re
+
+from question_parser import SCORED_ANSWERS, normalize_answer
+
+EXTRA_ANSWERS = 4  # Answers only used by the bot
+
+# Shape of a response in JSON mode, sent to the model in the prompt
+QUESTION_SET_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "questions": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "question": {"type": "string"},
+                    "answers": {
+                        "type": "array",
+                        "minItems": SCORED_ANSWERS,
+                        "maxItems": SCORED_ANSWERS,
+                        "items": {
+                            "type": "object",
+                            "properties": {
+                                "answer": {"type": "string"},
+                                "points": {"type": "integer"},
+                            },
+                            "required": ["answer", "points"],
+                        },
+                    },
+                    "extra_answers": {
+                        "type": "array",
+                        "minItems": EXTRA_ANSWERS,
+                        "maxItems": EXTRA_ANSWERS,
+                        "items": {"type": "string"},
+                    },
+                },
+                "required": ["question", "answers", "extra_answers"],
+            },
+        }
+    },
+    "required": ["questions"],
+}
+
+OUTSIDE_STRING = re.compile(r'[{}\[\]"]')
+INSIDE_STRING = re.compile(r'["\\]')
+
+
+class Question_Json_Parser:
+    """
+    Incremental decoder for responses in JSON mode
+
+    Same interface as Question_Parser. Only brackets and quotes are looked at while
+    the text streams in, and each question object is decoded and checked against
+    QUESTION_SET_SCHEMA as soon as its closing brace arrives.
+    """
+
+    def __init__(self):
+        self._buffer = ""  # Text from the start of the current question object
+        self._pos = 0  # Scanned up to here in the buffer
+        self._depth = 0  # Open brackets
+        self._in_string = False
+        self._list_depth = None  # Depth inside the array holding the questions
+        self._start = None  # Buffer position of the current question object
+        self.invalid = 0  # Question objects that did not match the schema
+
+    def feed(self, text: str) -> list[tuple[dict, list[str]]]:
+        """
+        Decode a chunk of the response
+
+        Returns:
+            list[tuple[dict, list[str]]]: (question, opponent answers) of each question completed by this chunk
+        """
+        self._buffer += text
+        done = list()
+        buffer = self._buffer
+        pos = self._pos
+        while True:
+            if self._in_string:
+                match = INSIDE_STRING.search(buffer, pos)
+                if match is None:
+                    pos = len(buffer)
+                    break
+                if match.group() == "\\":
+                    if match.end() == len(buffer):  # Escaped character not here yet
+                        pos = match.start()
+                        break
+                    pos = match.end() + 1
+                    continue
+                self._in_string = False
+                pos = match.end()
+                continue
+
+            match = OUTSIDE_STRING.search(buffer, pos)
+            if match is None:
+                pos = len(buffer)
+                break
+            pos = match.end()
+            char = match.group()
+            if char == '"':
+                self._in_string = True
+            elif char in "[{":
+                self._depth += 1
+                if char == "[" and self._list_depth is None:
+                    self._list_depth = self._depth
+                elif (
+                    char == "{"
+                    and self._list_depth is not None
+                    and self._depth == self._list_depth + 1
+                ):
+                    self._start = match.start()
+            else:
+                if (
+                    char == "}"
+                    and self._start is not None
+                    and self._depth == self._list_depth + 1
+                ):
+                    self._decode(buffer[self._start : pos], done)
+                    # Everything before the next question is not needed any more
+                    buffer = buffer[pos:]
+                    pos = 0
+                    self._start = None
+                self._depth -= 1
+
+        if self._start is None and not self._in_string:
+            buffer, pos = buffer[pos:], 0
+        self._buffer = buffer
+        self._pos = pos
+        return done
+
+    def close(self) -> list[tuple[dict, list[str]]]:
+        """Nothing is left to decode at the end, a cut off question object is dropped"""
+        self._buffer = ""
+        self._pos = 0
+        self._start = None
+        return list()
+
+    def _decode(self, text, done):
+        try:
+            value = json.loads(text)
+        except ValueError:
+            self.invalid += 1
+            return
+        parsed = question_from_json(value)
+        if parsed is None:
+            self.invalid += 1
+        else:
+            done.append(parsed)
+
+
+def question_from_json(value) -> tuple[dict, list[str]]:
+    """
+    Check one question object against QUESTION_SET_SCHEMA
+
+    Returns:
+        tuple[dict, list[str]] or None: (question, opponent answers), None if the object does not match
+    """
+    if not isinstance(value, dict):
+        return None
+    text = value.get("question")
+    answers = value.get("answers")
+    extra = value.get("extra_answers")
+    if (
+        not isinstance(text, str)
+        or not text.strip()
+        or not isinstance(answers, list)
+        or len(answers) != SCORED_ANSWERS
+        or not isinstance(extra, list)
+    ):
+        return None
+
+    oppo_list = list()
+    points = list()
+    for item in answers:
+        if not isinstance(item, dict):
+            return None
+        answer = item.get("answer")
+        point = item.get("points")
+        # bool is an int too, but never a score
+        if (
+            not isinstance(answer, str)
+            or not normalize_answer(answer)
+            or not isinstance(point, int)
+            or isinstance(point, bool)
+        ):
+            return None
+        oppo_list.append(answer.strip())
+        points.append(point)
+    oppo_list += [
+        answer.strip()
+        for answer in extra[:EXTRA_ANSWERS]
+        if isinstance(answer, str) and answer.strip()
+    ]
+
+    question = {
+        "question": text.strip(),
+        "answer": [normalize_answer(answer) for answer in oppo_list[:SCORED_ANSWERS]],
+        "points": points,
+    }
+    return (question, oppo_list)
+
+
+def parse_json_questions(text: str) -> tuple[list[dict], list[list[str]]]:
+    """Decode a complete JSON mode response into the (questions, oppo_answers) tuple"""
+    parser = Question_Json_Parser()
+    parsed = parser.feed(text) + parser.close()
+    return ([question for question, _ in parsed], [oppo for _, oppo in parsed])
+
+
+def format_json_completion(questions: list[dict], oppo_answers: list[list[str]]) -> str:
+    """Write questions as a JSON mode response, the inverse of parse_json_questions"""
+    items = list()
+    for question, oppo_list in zip(questions, oppo_answers):
+        names = list(oppo_list) + question["answer"][len(oppo_list) :]
+        items.append(
+            {
+                "question": question["question"],
+                "answers": [
+                    {"answer": name, "points": points}
+                    for name, points in zip(names, question["points"])
+                ],
+                "extra_answers": names[SCORED_ANSWERS:],
+            }
+        )
+    return json.dumps({"questions": items}, indent=2)
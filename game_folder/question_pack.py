@@ -0,0 +1,203 @@
+import mmap
+import random
+import struct
+
+from question_cache import theme_key
+
+# File layout, all numbers little-endian:
+#   header       HEADER, padded to HEADER_SIZE bytes
+#   theme table  THEME_ENTRY per theme: theme string, first record, record count
+#   index        RECORD per question, records of a theme are stored next to each other
+#   offsets      uint32 per string plus one, string i is data[offsets[i]:offsets[i + 1]]
+#   data         UTF-8 text of all strings, each distinct string is stored once
+PACK_MAGIC = b"GTAPACK\x00"
+PACK_VERSION = 1
+HEADER = struct.Struct("<8sHHIIIQQQQ")
+HEADER_SIZE = 64
+THEME_ENTRY = struct.Struct("<III")
+# theme, question, number of opponent answers, 6 answers, 6 points, 10 opponent answers
+RECORD = struct.Struct("<IIB3x6I6H10I")
+OFFSET = struct.Struct("<I")
+NO_STRING = 0xFFFFFFFF  # Unused opponent answer slot
+SCORED_ANSWERS = 6
+MAX_OPPO_ANSWERS = 10
+
+
+class Question_Pack:
+    """
+    Read-only question pack, memory-mapped so opening is instant whatever the size
+
+    Only the header and theme table are read on open, a question is decoded from its
+    index record and strings when it is asked for.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = open(path, "rb")
+        self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        (
+            magic,
+            version,
+            record_size,
+            self.num_questions,
+            self.num_strings,
+            num_themes,
+            theme_offset,
+            self._index_offset,
+            self._offsets_offset,
+            self._data_offset,
+        ) = HEADER.unpack_from(self._mmap, 0)
+        if magic != PACK_MAGIC or record_size != RECORD.size:
+            self.close()
+            raise ValueError(f"{path} is not a question pack")
+        if version != PACK_VERSION:
+            self.close()
+            raise ValueError(f"Unsupported question pack version {version}")
+
+        self._themes = dict()  # theme key -> (first record, record count)
+        for i in range(num_themes):
+            string_id, first, count = THEME_ENTRY.unpack_from(
+                self._mmap, theme_offset + i * THEME_ENTRY.size
+            )
+            self._themes[self.string(string_id)] = (first, count)
+
+    def __len__(self):
+        return self.num_questions
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self._mmap.close()
+        self._file.close()
+
+    def themes(self) -> list[str]:
+        return list(self._themes)
+
+    def string(self, string_id: int) -> str:
+        position = self._offsets_offset + string_id * OFFSET.size
+        start = OFFSET.unpack_from(self._mmap, position)[0]
+        end = OFFSET.unpack_from(self._mmap, position + OFFSET.size)[0]
+        return self._mmap[self._data_offset + start : self._data_offset + end].decode(
+            "utf-8"
+        )
+
+    def question(self, index: int) -> tuple[dict, list[str]]:
+        """Decode question index into (question dict, opponent answers)"""
+        if not 0 <= index < self.num_questions:
+            raise IndexError("question index out of range")
+        fields = RECORD.unpack_from(
+            self._mmap, self._index_offset + index * RECORD.size
+        )
+        num_oppo = fields[2]
+        answers = fields[3 : 3 + SCORED_ANSWERS]
+        points = fields[3 + SCORED_ANSWERS : 3 + 2 * SCORED_ANSWERS]
+        oppo = fields[3 + 2 * SCORED_ANSWERS : 3 + 2 * SCORED_ANSWERS + num_oppo]
+        question = {
+            "question": self.string(fields[1]),
+            "answer": [self.string(i) for i in answers],
+            "points": list(points),
+        }
+        return (question, [self.string(i) for i in oppo])
+
+    def get_questions(self, theme: str = None, rng=random):
+        """
+        Pick 3 random questions, same return value as Question_Generator.get_questions
+
+        Questions of any theme are used if theme is None or not in the pack
+        """
+        picked = self.sample(theme, 3, rng)
+        return ([question for question, _ in picked], [oppo for _, oppo in picked])
+
+    def sample(
+        self, theme: str = None, count: int = 3, rng=random
+    ) -> list[tuple[dict, list[str]]]:
+        """Pick count distinct random questions as (question dict, opponent answers)"""
+        first, size = self._themes.get(theme_key(theme), (0, self.num_questions))
+        if size < count:
+            first, size = 0, self.num_questions
+        if size < count:
+            raise ValueError(f"{self.path} has fewer than {count} questions")
+        return [self.question(first + i) for i in rng.sample(range(size), count)]
+
+
+def write_pack(path: str, entries) -> int:
+    """
+    Write a question pack
+
+    Args:
+        path (str): Output file
+        entries: Iterable of (theme, question dict, opponent answers), questions without 6 answers are skipped
+
+    Returns:
+        int: Number of questions written
+    """
+    string_ids = dict()
+    strings = list()
+
+    def string_id(text):
+        if text not in string_ids:
+            string_ids[text] = len(strings)
+            strings.append(text)
+        return string_ids[text]
+
+    records = dict()  # theme key -> list of record fields
+    for theme, question, oppo_list in entries:
+        if (
+            len(question["answer"]) != SCORED_ANSWERS
+            or len(question["points"]) != SCORED_ANSWERS
+        ):
+            continue
+        oppo_list = list(oppo_list)[:MAX_OPPO_ANSWERS]
+        key = theme_key(theme)
+        string_id(key)
+        fields = [string_id(key), string_id(question["question"]), len(oppo_list)]
+        fields += [string_id(answer) for answer in question["answer"]]
+        fields += [min(max(int(points), 0), 0xFFFF) for points in question["points"]]
+        fields += [string_id(answer) for answer in oppo_list]
+        fields += [NO_STRING] * (MAX_OPPO_ANSWERS - len(oppo_list))
+        records.setdefault(key, list()).append(fields)
+
+    themes = sorted(records)
+    num_questions = sum(len(records[key]) for key in themes)
+    data = [text.encode("utf-8") for text in strings]
+
+    theme_offset = HEADER_SIZE
+    index_offset = theme_offset + len(themes) * THEME_ENTRY.size
+    offsets_offset = index_offset + num_questions * RECORD.size
+    data_offset = offsets_offset + (len(strings) + 1) * OFFSET.size
+
+    with open(path, "wb") as f:
+        header = HEADER.pack(
+            PACK_MAGIC,
+            PACK_VERSION,
+            RECORD.size,
+            num_questions,
+            len(strings),
+            len(themes),
+            theme_offset,
+            index_offset,
+            offsets_offset,
+            data_offset,
+        )
+        f.write(header.ljust(HEADER_SIZE, b"\x00"))
+
+        first = 0
+        for key in themes:
+            f.write(THEME_ENTRY.pack(string_ids[key], first, len(records[key])))
+            first += len(records[key])
+        for key in themes:
+            for fields in records[key]:
+                f.write(RECORD.pack(*fields))
+
+        position = 0
+        for text in data:
+            f.write(OFFSET.pack(position))
+            position += len(text)
+        f.write(OFFSET.pack(position))
+        for text in data:
+            f.write(text)
+    return num_questions
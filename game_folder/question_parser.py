@@ -0,0 +1,135 @@
+import re
+
+# Answers asked for in the prompt, all of them are used by the bot
+ANSWERS_PER_QUESTION = 10
+SCORED_ANSWERS = 6  # The first answers are the ones that give points
+
+# One line of the response, either a question header or a list item
+#   "Question 1: ...", "Q1: ...", "**Question 12.** ...", "### Q3) ..."
+#   "1. Answer (30)", "2) Two Words (15 pts)", "- Answer (5 points)"
+# Other text only counts as the question when the header line has none
+LINE_PATTERN = re.compile(
+    r"""
+    ^[ \t]*(?:[#]+[ \t]*)?\**(?![ \t])
+    (?:
+        (?i:question[ \t]*\d*|q[ \t]*\d+)[ \t]*\**[ \t]*[:.)-]\**[ \t]*(?P<question>.*)
+      |
+        (?:\d+[.)]|[-*\u2022])[ \t]+
+        (?:
+            (?P<answer>.*)\([ \t]*(?P<points>\d+)[ \t]*(?i:pts?|points?)?\.?[ \t]*\)[ \t*]*\r?$
+          |
+            (?P<extra>.*)
+        )
+      |
+        (?P<text>[^ \t\r\n*#].*)
+    )
+    """,
+    re.MULTILINE | re.VERBOSE,
+)
+STRIP = " \t\r*"  # Left around the text by the greedy groups
+
+
+class Question_Parser:
+    """
+    Incremental parser for the LLM response
+
+    Text can be fed in chunks of any size as it streams in, every completed question is
+    returned as soon as its answer list is complete, without waiting for the rest.
+    Each line is matched once by LINE_PATTERN, so nothing is scanned twice.
+    """
+
+    def __init__(self):
+        self._buffer = ""  # Incomplete last line
+        self._question = None  # Question being parsed
+        self._oppo_list = None  # All answers of the question being parsed
+
+    def feed(self, text: str) -> list[tuple[dict, list[str]]]:
+        """
+        Parse a chunk of the response
+
+        Returns:
+            list[tuple[dict, list[str]]]: (question, opponent answers) of each question completed by this chunk
+        """
+        done = list()
+        end = text.rfind("\n")
+        if end == -1:
+            self._buffer += text
+            return done
+        if self._buffer:
+            text = self._buffer + text
+            end += len(self._buffer)
+        self._parse(text, end, done)
+        self._buffer = text[end + 1 :]
+        return done
+
+    def close(self) -> list[tuple[dict, list[str]]]:
+        """Parse what is left at the end of the response"""
+        done = list()
+        if self._buffer:
+            self._parse(self._buffer, len(self._buffer), done)
+            self._buffer = ""
+        self._finish(done)
+        return done
+
+    def _parse(self, text, end, done):
+        """Parse the complete lines in text[:end]"""
+        # Locals are much faster than attributes in this loop, saved again at the end
+        question, oppo_list = self._question, self._oppo_list
+        for match in LINE_PATTERN.finditer(text, 0, end):
+            kind = match.lastgroup  # Last group of the alternative that matched
+            if kind == "question":
+                self._emit(question, oppo_list, done)  # start a new question
+                question = {
+                    "question": match.group("question").strip(STRIP),
+                    "answer": [],
+                    "points": [],
+                }
+                oppo_list = list()
+                continue
+            if question is None:  # No question yet
+                continue
+            if kind == "text":
+                # "Question 1:" with the question on the next line
+                if not question["question"] and not oppo_list:
+                    question["question"] = match.group("text").strip(STRIP)
+                continue
+
+            if kind == "points":
+                display, points = match.group("answer", "points")
+                display = display.strip(STRIP)
+            else:
+                display = match.group("extra").strip(STRIP)
+                points = 0
+            # Opponent answers keep the original case and spaces
+            oppo_list.append(display)
+            if len(oppo_list) <= SCORED_ANSWERS:
+                question["answer"].append(normalize_answer(display))
+                question["points"].append(int(points))
+            elif len(oppo_list) == ANSWERS_PER_QUESTION:
+                self._emit(question, oppo_list, done)
+                question = oppo_list = None
+        self._question, self._oppo_list = question, oppo_list
+
+    def _finish(self, done):
+        """Emit the current question and start waiting for the next header"""
+        self._emit(self._question, self._oppo_list, done)
+        self._question = None
+        self._oppo_list = None
+
+    @staticmethod
+    def _emit(question, oppo_list, done):
+        """Add the question to done if it has all scored answers"""
+        if question is not None and len(question["answer"]) == SCORED_ANSWERS:
+            done.append((question, oppo_list))
+
+
+def normalize_answer(text: str) -> str:
+    """Answer as stored in a question dict, lowercase without spaces"""
+    return "".join(text.split()).lower()
+
+
+def parse_questions(text: str) -> tuple[list[dict], list[list[str]]]:
+    """Parse a complete response into the (questions, oppo_answers) tuple"""
+    parser = Question_Parser()
+    parsed = parser.feed(text) + parser.close()
+    return ([question for question, _ in parsed], [oppo for _, oppo in parsed])
@@ -0,0 +1,210 @@
+import threading
+import time
+from collections import deque
+
+from question_cache import theme_key
+from question_prefetch import is_valid_question_set
+from question_set import Question_Set
+
+
+class Question_Pool:
+    """
+    Pool of ready question sets for each theme
+
+    Background workers top a theme up to high_watermark sets whenever it drops below
+    low_watermark, so a burst of new games can each pop a set without waiting.
+    """
+
+    def __init__(
+        self,
+        fetch_func,
+        batch_func=None,
+        low_watermark: int = 1,
+        high_watermark: int = 3,
+        num_workers: int = 1,
+        max_age: float = 3600,
+        retry_delay: float = 5,
+    ):
+        """
+        Args:
+            fetch_func (callable): Called as fetch_func(theme), returns (questions, oppo_answers)
+            batch_func (callable, optional): Called as batch_func(theme, n), returns a list of up to n sets. Used instead of fetch_func if given, so a refill needs one request.
+            low_watermark (int, optional): Refill a theme when it has fewer ready sets than this. Defaults to 1.
+            high_watermark (int, optional): Stop refilling a theme at this many sets. Defaults to 3.
+            num_workers (int, optional): Number of refill threads. Defaults to 1.
+            max_age (float, optional): Seconds before a ready set is considered stale and dropped. Defaults to 3600.
+            retry_delay (float, optional): Seconds to wait before refilling a theme after a failed fetch. Defaults to 5.
+        """
+        if not 0 < low_watermark <= high_watermark:
+            raise ValueError("Need 0 < low_watermark <= high_watermark")
+        self.fetch_func = fetch_func
+        self.batch_func = batch_func
+        self.low_watermark = low_watermark
+        self.high_watermark = high_watermark
+        self.num_workers = num_workers
+        self.max_age = max_age
+        self.retry_delay = retry_delay
+        self.fetched = 0  # Sets added to the pool
+        self.failed = 0  # Failed fetches
+        self.hits = 0  # pop() calls that got a set
+        self.misses = 0  # pop() calls on an empty pool
+        self._cond = threading.Condition()
+        self._sets = dict()  # theme key -> deque of (fetch time, Question_Set)
+        self._themes = dict()  # theme key -> theme passed to fetch_func
+        self._kept = set()  # theme keys refilled, removed ones only keep their sets
+        self._in_flight = dict()  # theme key -> number of running fetches
+        self._retry_at = dict()  # theme key -> time the theme may be fetched again
+        self._refilling = set()  # theme keys being topped up to the high watermark
+        self._workers = list()
+        self._stopped = False
+
+    def start(self):
+        """Start the refill threads"""
+        with self._cond:
+            self._stopped = False
+            while len(self._workers) < self.num_workers:
+                worker = threading.Thread(target=self._refill_loop, daemon=True)
+                self._workers.append(worker)
+                worker.start()
+
+    def stop(self):
+        """Stop the refill threads, fetches already running are finished in the background"""
+        with self._cond:
+            self._stopped = True
+            self._workers = list()
+            self._cond.notify_all()
+
+    def add_theme(self, theme: str = None):
+        """Keep sets of theme ready from now on"""
+        with self._cond:
+            self._add_theme(theme)
+
+    def remove_theme(self, theme: str = None):
+        """Stop refilling theme, its ready sets can still be popped until they are stale"""
+        with self._cond:
+            key = theme_key(theme)
+            self._kept.discard(key)
+            self._refilling.discard(key)
+
+    def pop(self, theme: str = None):
+        """
+        Take a ready set of theme. Never blocks
+
+        Returns:
+            Question_Set or None: None if no set of theme is ready
+        """
+        with self._cond:
+            key = self._add_theme(theme)
+            ready = self._sets[key]
+            now = time.monotonic()
+            while ready and now - ready[0][0] > self.max_age:
+                ready.popleft()
+            result = ready.popleft()[1] if ready else None
+            if result is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            self._check(key)
+            return result
+
+    def size(self, theme: str = None) -> int:
+        """Number of ready sets of theme"""
+        with self._cond:
+            return len(self._sets.get(theme_key(theme), ()))
+
+    def stats(self) -> dict:
+        with self._cond:
+            return {
+                "ready": {key: len(ready) for key, ready in self._sets.items()},
+                "in_flight": sum(self._in_flight.values()),
+                "fetched": self.fetched,
+                "failed": self.failed,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+    def _add_theme(self, theme):
+        """Register theme to be kept ready and return its key, caller must hold the lock"""
+        key = theme_key(theme)
+        if key not in self._sets:
+            self._themes[key] = theme
+            self._sets[key] = deque()
+            self._in_flight[key] = 0
+        if key not in self._kept:
+            self._kept.add(key)
+            self._check(key)
+        return key
+
+    def _check(self, key):
+        """Update the refill state of a theme and wake the workers, caller must hold the lock"""
+        ready = len(self._sets[key])
+        if key not in self._kept:
+            self._refilling.discard(key)
+        elif ready < self.low_watermark:
+            self._refilling.add(key)
+        elif ready >= self.high_watermark:
+            self._refilling.discard(key)
+        self._cond.notify_all()
+
+    def _next_theme(self):
+        """Key of a theme that needs another fetch, caller must hold the lock"""
+        now = time.monotonic()
+        for key in self._refilling:
+            if (
+                len(self._sets[key]) + self._in_flight[key] < self.high_watermark
+                and self._retry_at.get(key, 0) <= now
+            ):
+                return key
+        return None
+
+    def _retry_wait(self):
+        """Seconds until the next retry delay passes, caller must hold the lock"""
+        now = time.monotonic()
+        waits = [
+            self._retry_at[key] - now
+            for key in self._refilling
+            if self._retry_at.get(key, 0) > now
+        ]
+        return min(waits) if waits else None
+
+    def _refill_loop(self):
+        while True:
+            with self._cond:
+                key = self._next_theme()
+                while key is None and not self._stopped:
+                    self._cond.wait(timeout=self._retry_wait())
+                    key = self._next_theme()
+                if self._stopped:
+                    return
+                if self.batch_func is not None:  # Everything up to the high watermark
+                    count = (
+                        self.high_watermark
+                        - len(self._sets[key])
+                        - self._in_flight[key]
+                    )
+                else:
+                    count = 1
+                self._in_flight[key] += count
+                theme = self._themes[key]
+
+            try:
+                if self.batch_func is not None:
+                    results = self.batch_func(theme, count)
+                else:
+                    results = [self.fetch_func(theme)]
+                results = [
+                    result for result in results if is_valid_question_set(result)
+                ]
+            except Exception:  # Keep refilling, the theme is retried after retry_delay
+                results = list()
+
+            with self._cond:
+                self._in_flight[key] -= count
+                now = time.monotonic()
+                for result in results[:count]:
+                    self._sets[key].append((now, Question_Set.from_result(result)))
+                self.fetched += len(results[:count])
+                if not results:
+                    self.failed += 1
+                    self._retry_at[key] = now + self.retry_delay
+                self._check(key)
@@ -0,0 +1,180 @@
+import threading
+import time
+
+from question_set import Question, Question_Set
+
+
+class Partial_Set(Question_Set):
+    """
+    Question set that is filled while the response streams in
+
+    questions only ever grows, and each Question is complete when it is appended, so
+    questions[i] being there means everything of question i is there.
+    """
+
+    __slots__ = ("done", "error")
+
+    def __init__(self, questions=()):
+        super().__init__(questions)
+        self.done = False  # No more questions will be added
+        self.error = None  # Exception that stopped the stream early
+
+    def add(self, question, oppo_list):
+        self.questions.append(Question.from_dict(question, oppo_list))
+
+    @classmethod
+    def from_result(cls, result):
+        """Wrap a complete (questions, oppo_answers) tuple or Question_Set"""
+        partial = super().from_result(result)
+        partial.done = True
+        return partial
+
+
+class Question_Prefetcher:
+    """Fetch question sets on a background thread so the game loop never waits on the network"""
+
+    def __init__(self, fetch_func, stream_func=None, max_age=900, retry_delay=3):
+        """
+        Args:
+            fetch_func (callable): Called as fetch_func(theme), returns (questions, oppo_answers)
+            stream_func (callable, optional): Called as stream_func(theme), yields (question, oppo_list) as they arrive. Used instead of fetch_func if given.
+            max_age (float, optional): Seconds before a fetched set is considered stale. Defaults to 900.
+            retry_delay (float, optional): Seconds to wait before retrying a failed fetch. Defaults to 3.
+        """
+        self.fetch_func = fetch_func
+        self.stream_func = stream_func
+        self.max_age = max_age
+        self.retry_delay = retry_delay
+        self.theme = None  # Theme of the latest request
+        self.error = None  # Exception of the latest failed fetch
+        self._lock = threading.Lock()
+        self._generation = 0  # Increased on every request, older results are dropped
+        self._thread = None
+        self._partial = None  # Partial_Set of the running fetch
+        self._result = None  # (fetch time, (questions, oppo_answers))
+        self._failed_at = 0
+
+    def request(self, theme: str = None):
+        """Start fetching a set for theme, unless a fresh one is already fetched or on the way"""
+        with self._lock:
+            if theme == self.theme and self.error is None:
+                if self._thread is not None and self._thread.is_alive():
+                    return
+                if self._result is not None and not self._is_stale(self._result):
+                    return
+            self._start(theme)
+
+    def poll(self) -> bool:
+        """Check whether a set can be taken, retry failed fetches after retry_delay. Never blocks"""
+        with self._lock:
+            if self._result is not None and self._is_stale(self._result):
+                self._start(self.theme)  # Replace stale result with a new one
+            elif (
+                self.error is not None
+                and time.monotonic() - self._failed_at >= self.retry_delay
+            ):
+                self._start(self.theme)
+            return self._result is not None or self._has_partial()
+
+    def take(self, theme: str = None):
+        """
+        Return the fetched set and clear it. Never blocks
+
+        Returns:
+            tuple[list[dict], list[list[str]]] or None: None if no fresh set for theme is ready yet
+        """
+        with self._lock:
+            if theme != self.theme:
+                self._start(theme)
+                return None
+            if self._result is None or self._is_stale(self._result):
+                return None
+            result = self._result[1]
+            self._result = None
+            return result
+
+    def take_partial(self, theme: str = None):
+        """
+        Return the fetched set, or the set still being streamed if it has at least one question. Never blocks
+
+        Returns:
+            Partial_Set or None: None if no question for theme is ready yet
+        """
+        result = self.take(theme)
+        if result is not None:
+            return Partial_Set.from_result(result)
+
+        with self._lock:
+            if theme != self.theme or not self._has_partial():
+                return None
+            # The rest of the stream only goes to the caller, a new request starts a new fetch
+            partial = self._partial
+            self._partial = None
+            self._thread = None
+            self._generation += 1
+            return partial
+
+    def busy(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def _start(self, theme):
+        """Start a new worker thread, caller must hold the lock"""
+        self._generation += 1
+        self.theme = theme
+        self.error = None
+        self._result = None
+        self._partial = Partial_Set()
+        self._thread = threading.Thread(
+            target=self._worker,
+            args=(self._generation, theme, self._partial),
+            daemon=True,
+        )
+        self._thread.start()
+
+    def _worker(self, generation, theme, partial):
+        try:
+            if self.stream_func is not None:
+                for question, oppo_list in self.stream_func(theme):
+                    partial.add(question, oppo_list)
+                result = partial.to_result()
+            else:
+                result = self.fetch_func(theme)
+            if not is_valid_question_set(result):
+                raise ValueError("Incomplete question set received")
+        except Exception as e:  # Keep the game running, poll() retries later
+            partial.error = e
+            partial.done = True
+            with self._lock:
+                if generation == self._generation:
+                    self.error = e
+                    self._failed_at = time.monotonic()
+                    self._partial = None
+            return
+
+        partial.done = True
+        with self._lock:
+            if generation == self._generation:  # Drop results of outdated requests
+                self._result = (time.monotonic(), result)
+                self._partial = None
+
+    def _has_partial(self) -> bool:
+        return self._partial is not None and len(self._partial.questions) > 0
+
+    def _is_stale(self, entry) -> bool:
+        return time.monotonic() - entry[0] > self.max_age
+
+
+def is_valid_question_set(result) -> bool:
+    """Check that a (questions, oppo_answers) tuple has 3 complete questions"""
+    try:
+        questions, oppo_answers = result
+    except (TypeError, ValueError):
+        return False
+    if len(questions) != 3 or len(oppo_answers) != 3:
+        return False
+    for question, oppo_list in zip(questions, oppo_answers):
+        if len(question.get("answer", [])) != 6 or len(question.get("points", [])) != 6:
+            return False
+        if len(oppo_list) < 6:
+            return False
+    return True
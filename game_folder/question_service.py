@@ -0,0 +1,68 @@
+import asyncio
+
+from question_cache import theme_key
+from question_generator import Question_Generator
+
+
+class Question_Service:
+    """
+    asyncio front end of the question generator
+
+    Requests for the same theme that arrive while a fetch is running share that fetch
+    (single-flight) instead of each making their own LLM call. Different themes are
+    fetched concurrently, at most max_concurrency at a time.
+    """
+
+    def __init__(self, fetch_func=None, max_concurrency: int = 4):
+        """
+        Args:
+            fetch_func (callable, optional): Blocking fetch called as fetch_func(theme) in a worker thread. Defaults to Question_Generator.get_questions.
+            max_concurrency (int, optional): Maximum fetches running at the same time. Defaults to 4.
+        """
+        if fetch_func is None:
+            fetch_func = Question_Generator.get_questions
+        self.fetch_func = fetch_func
+        self.max_concurrency = max_concurrency
+        self.requests = 0  # Calls of get_questions
+        self.fetches = 0  # Fetches actually started
+        self._semaphore = None  # Created in the running event loop
+        self._in_flight = dict()  # theme key -> asyncio.Task
+
+    async def get_questions(self, theme: str = None):
+        """
+        Get a question set, joining the running fetch of the same theme if there is one
+
+        Returns:
+            tuple[list[dict], list[list[str]]]: Same as Question_Generator.get_questions
+        """
+        self.requests += 1
+        key = theme_key(theme)
+        task = self._in_flight.get(key)
+        if task is None:
+            self.fetches += 1
+            task = asyncio.ensure_future(self._fetch(theme))
+            self._in_flight[key] = task
+            task.add_done_callback(lambda _: self._in_flight.pop(key, None))
+        # A cancelled caller must not cancel the fetch the other callers are waiting on
+        return await asyncio.shield(task)
+
+    async def get_many(self, themes: list[str]) -> list:
+        """Get one question set for each theme, fetched concurrently"""
+        return await asyncio.gather(*(self.get_questions(theme) for theme in themes))
+
+    def in_flight(self) -> int:
+        return len(self._in_flight)
+
+    def stats(self) -> dict:
+        return {
+            "requests": self.requests,
+            "fetches": self.fetches,
+            "coalesced": self.requests - self.fetches,
+            "in_flight": self.in_flight(),
+        }
+
+    async def _fetch(self, theme):
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        async with self._semaphore:
+            return await asyncio.to_thread(self.fetch_func, theme)
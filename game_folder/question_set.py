@@ -0,0 +1,83 @@
+import sys
+from array import array
+
+from answer_match import Answer_Key
+
+
+class Question:
+    """
+    One question of a game, a compact form of the question dict and its opponent answers
+
+    Slots instead of a dict per question, the points in an array('H') and the normalized
+    answers interned, so the many sets kept ready in memory stay small. The Answer_Keys used
+    to judge guesses are built by answer_keys() for the question in play only.
+    """
+
+    __slots__ = ("text", "answers", "display", "points")
+
+    def __init__(self, text: str, answers, display, points):
+        """
+        Args:
+            text (str): The question
+            answers (iterable of str): Normalized scored answers, matched against the player input
+            display (iterable of str): All answers as shown and used by the bot, the scored ones first
+            points (iterable of int): Points of each scored answer
+        """
+        self.text = text
+        self.answers = tuple(sys.intern(answer) for answer in answers)
+        self.display = tuple(display)
+        # Scores are small and never negative, two bytes each is plenty
+        self.points = array("H", [min(max(point, 0), 0xFFFF) for point in points])
+
+    def __repr__(self):
+        return f"Question({self.text!r}, {list(self.answers)!r}, {list(self.points)!r})"
+
+    def answer_keys(self) -> tuple[Answer_Key, ...]:
+        """Answer_Key of each scored answer, built anew on every call"""
+        return tuple(Answer_Key(answer) for answer in self.answers)
+
+    @classmethod
+    def from_dict(cls, question: dict, oppo_list: list[str]) -> "Question":
+        """Convert a question dict and its opponent answers"""
+        return cls(
+            question["question"], question["answer"], oppo_list, question["points"]
+        )
+
+    def to_dict(self) -> tuple[dict, list[str]]:
+        """The (question, opponent answers) pair used by the cache and the packs"""
+        question = {
+            "question": self.text,
+            "answer": list(self.answers),
+            "points": self.points.tolist(),
+        }
+        return (question, list(self.display))
+
+
+class Question_Set:
+    """The questions of one game"""
+
+    __slots__ = ("questions",)
+
+    def __init__(self, questions=()):
+        self.questions = list(questions)
+
+    def __len__(self):
+        return len(self.questions)
+
+    def __getitem__(self, index) -> Question:
+        return self.questions[index]
+
+    def __iter__(self):
+        return iter(self.questions)
+
+    @classmethod
+    def from_result(cls, result) -> "Question_Set":
+        """Convert a (questions, oppo_answers) tuple, a Question_Set is copied"""
+        if isinstance(result, Question_Set):
+            return cls(result.questions)
+        return cls(map(Question.from_dict, *result))
+
+    def to_result(self) -> tuple[list[dict], list[list[str]]]:
+        """The (questions, oppo_answers) tuple used by the cache and the packs"""
+        pairs = [question.to_dict() for question in self.questions]
+        return ([question for question, _ in pairs], [oppo for _, oppo in pairs])
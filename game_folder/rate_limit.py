@@ -0,0 +1,141 @@
+import random
+import threading
+import time
+
+
+class Rate_Limiter:
+    """
+    Requests and tokens per minute budget shared by worker threads
+
+    Both budgets are token buckets refilled continuously, holding at most burst_seconds
+    worth of budget. A 429 response halves the rate and pauses every worker for the
+    Retry-After time, or an exponential backoff if the server gave none. Each success
+    then recovers a little of the rate (additive increase, multiplicative decrease).
+    """
+
+    def __init__(
+        self,
+        requests_per_minute: float = 60,
+        tokens_per_minute: float = None,
+        burst_seconds: float = 10,
+        min_scale: float = 0.05,
+        recovery: float = 0.05,
+        max_backoff: float = 60,
+    ):
+        """
+        Args:
+            requests_per_minute (float, optional): Request budget. Defaults to 60.
+            tokens_per_minute (float, optional): Token budget, None for no limit. Defaults to None.
+            burst_seconds (float, optional): Seconds of budget that can be used at once. Defaults to 10.
+            min_scale (float, optional): Lowest share of the budget backoff goes down to. Defaults to 0.05.
+            recovery (float, optional): Share of the budget regained per success. Defaults to 0.05.
+            max_backoff (float, optional): Longest pause in seconds after a 429. Defaults to 60.
+        """
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.burst_seconds = burst_seconds
+        self.min_scale = min_scale
+        self.recovery = recovery
+        self.max_backoff = max_backoff
+        self.scale = 1.0  # Share of the budget in use, lowered by 429s
+        self.rate_limited_count = 0
+        self.waited = 0.0  # Seconds workers spent waiting for budget
+        self._cond = threading.Condition()
+        now = time.monotonic()
+        self._requests = self._capacity(requests_per_minute)
+        self._tokens = self._capacity(tokens_per_minute)
+        self._refilled_at = now
+        self._paused_until = now
+        self._backoff = 1.0  # Pause after the next 429 without Retry-After
+
+    def acquire(self, tokens: int = 0):
+        """Block until a request of about tokens tokens fits in the budget, then use it up"""
+        start = time.monotonic()
+        with self._cond:
+            while True:
+                now = time.monotonic()
+                self._refill(now)
+                wait = self._paused_until - now
+                if wait <= 0:
+                    wait = max(
+                        self._shortfall(self._requests, 1, self.requests_per_minute),
+                        self._shortfall(self._tokens, tokens, self.tokens_per_minute),
+                    )
+                if wait <= 0:
+                    self._requests -= 1
+                    if self.tokens_per_minute is not None:
+                        self._tokens -= tokens
+                    self.waited += now - start
+                    return
+                self._cond.wait(wait)
+
+    def success(self):
+        """A request went through, recover some of the rate"""
+        with self._cond:
+            self.scale = min(1.0, self.scale + self.recovery)
+            self._backoff = 1.0
+
+    def rate_limited(self, retry_after: float = None):
+        """A request got a 429, slow down and pause every worker"""
+        with self._cond:
+            self.rate_limited_count += 1
+            self.scale = max(self.min_scale, self.scale / 2)
+            if retry_after is None:
+                # Jitter so the workers do not all come back at the same moment
+                retry_after = self._backoff * random.uniform(0.5, 1.5)
+                self._backoff = min(self._backoff * 2, self.max_backoff)
+            pause = min(retry_after, self.max_backoff)
+            self._paused_until = max(self._paused_until, time.monotonic() + pause)
+            self._cond.notify_all()
+
+    def stats(self) -> dict:
+        with self._cond:
+            return {
+                "scale": round(self.scale, 3),
+                "rate_limited": self.rate_limited_count,
+                "waited": round(self.waited, 1),
+            }
+
+    def _capacity(self, per_minute):
+        if per_minute is None:
+            return 0
+        return max(1.0, per_minute * self.burst_seconds / 60)
+
+    def _refill(self, now):
+        """Caller must hold the lock"""
+        elapsed = now - self._refilled_at
+        self._refilled_at = now
+        if self.requests_per_minute is not None:
+            self._requests = min(
+                self._capacity(self.requests_per_minute),
+                self._requests + elapsed * self.requests_per_minute * self.scale / 60,
+            )
+        if self.tokens_per_minute is not None:
+            self._tokens = min(
+                self._capacity(self.tokens_per_minute),
+                self._tokens + elapsed * self.tokens_per_minute * self.scale / 60,
+            )
+
+    def _shortfall(self, level, amount, per_minute):
+        """Seconds until level reaches amount, a request larger than the bucket waits for a full one"""
+        if per_minute is None:
+            return 0
+        amount = min(amount, self._capacity(per_minute))
+        if level >= amount:
+            return 0
+        return (amount - level) * 60 / (per_minute * self.scale)
+
+
+def retry_after(error) -> float:
+    """Seconds from the Retry-After header of an HTTP error, None if it has none"""
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None) or dict()
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+def is_rate_limited(error) -> bool:
+    """Whether an exception is a 429 Too Many Requests response"""
+    return getattr(error, "status_code", None) == 429
@@ -1,14 +1,22 @@
-from dotenv import load_dotenv
-from openai import AzureOpenAI
 import os
+import sys
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "game_folder"))
+from llm_client import get_client
+from question_cache import get_default_cache
+from question_parser import parse_questions
 
-def get_questions(theme: str = None) -> list[dict]:
+# The cache is shared with the game, keep the keys apart
+PROMPT_VERSION = "standalone-1"
+
+
+def get_questions(theme: str = None, use_cache: bool = True) -> list[dict]:
     """
     Generate questions and answers based on a specified theme
 
     Args:
         theme (str, optional): Theme for the questions. Defaults to None.
+        use_cache (bool, optional): Serve and store sets in the question cache. Defaults to True.
 
     Returns:
         list[dict]: A list of 3 question dictionaries, each containing:
@@ -16,15 +24,14 @@ def get_questions(theme: str = None) -> list[dict]:
             - answer (list[str]): List of the 6 answers
             - points (list[int]): Corresponding points for each answer
     """
-    load_dotenv()
-    AZURE_API_KEY = os.getenv("AZURE_API_KEY")
+    cache = get_default_cache() if use_cache else None
+    if cache is not None:
+        cached = cache.get(theme, PROMPT_VERSION)
+        if cached is not None:
+            return cached
 
-    # Initialize the client
-    client = AzureOpenAI(
-        azure_endpoint="https://cuhk-apip.azure-api.net",
-        api_version="2024-06-01",
-        api_key=AZURE_API_KEY,
-    )
+    # Shared client, its connections are kept alive between calls
+    client = get_client()
 
     theme_prompt = ""
     if theme != None:
@@ -50,38 +57,12 @@ def get_questions(theme: str = None) -> list[dict]:
         ],
         temperature=0.9,
     )
-    res = response.choices[0].message.content
-    # print(res)
-    res = res.split("\n")
-
-    ret = list()
-    temp = dict()  # store current question
-    for line in res:
-        if line.find("Question") != -1:
-            temp = dict()  # start a new question
-            text = line[12:]
-            temp["question"] = text
-        else:
-            answer = ""
-            points = 0
-            text = line.split()
-            for word in text:
-                if word.isalpha():
-                    if answer != "":
-                        answer += " "
-                    answer += word
-                elif word[0] == "(":
-                    points = int(word[1:-1])
-            if not "answer" in temp:
-                temp["answer"] = list()
-                temp["points"] = list()
-            if len(temp["answer"]) == 5:
-                temp["answer"].append(answer)
-                temp["points"].append(points)
-                ret.append(temp)
-            elif len(temp["answer"]) < 5:
-                temp["answer"].append(answer)
-                temp["points"].append(points)
+    ret, oppo_answers = parse_questions(response.choices[0].message.content)
+    # Answers keep their case and spaces here
+    for question, oppo_list in zip(ret, oppo_answers):
+        question["answer"] = oppo_list[: len(question["answer"])]
+    if cache is not None and len(ret) == 3:
+        cache.put(theme, PROMPT_VERSION, ret, uses=1)
     return ret
 
 